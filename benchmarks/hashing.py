@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Compare torf's `Torrent.generate` with pptu's parallel piece hasher.
+
+Usage: python benchmarks/hashing.py [PATH] [--size MIB] [--workers 1,2,4,8]
+
+Without PATH a temporary file of --size MiB is generated. Pass --drop-caches
+(requires root on Linux) to measure cold reads instead of page cache speed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+from torf import Torrent
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pptu.hashing import hash_torrent  # noqa: E402
+
+
+def drop_caches() -> None:
+    subprocess.run(["sync"], check=True)
+    Path("/proc/sys/vm/drop_caches").write_text("3\n")
+
+
+def run(path: Path, workers: int | None, *, cold: bool) -> tuple[float, bytes]:
+    torrent = Torrent(path, private=True, created_by=None, creation_date=None)
+    if cold:
+        drop_caches()
+    start = time.perf_counter()
+    if workers is None:
+        torrent.generate()
+    else:
+        hash_torrent(torrent, workers=workers)
+    return time.perf_counter() - start, torrent.metainfo["info"]["pieces"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=Path, nargs="?")
+    parser.add_argument("--size", type=int, default=2048, help="MiB of test data")
+    parser.add_argument(
+        "--workers", type=lambda x: [int(y) for y in x.split(",")], default=[1, 2, 4, 8]
+    )
+    parser.add_argument("--drop-caches", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if not path:
+            path = Path(tmp, "sample.bin")
+            with path.open("wb") as fd:
+                for _ in range(args.size):
+                    fd.write(os.urandom(1024 * 1024))
+
+        files = [path] if path.is_file() else [x for x in path.rglob("*") if x.is_file()]
+        size = sum(x.stat().st_size for x in files)
+        # Warm up the page cache so every run starts from the same state
+        if not args.drop_caches:
+            run(path, 1, cold=False)
+
+        table = Table(title=f"Hashing {size / 1024**2:.0f} MiB")
+        table.add_column("Engine")
+        table.add_column("Time", justify="right")
+        table.add_column("MB/s", justify="right")
+        table.add_column("Identical", justify="center")
+
+        elapsed, reference = run(path, None, cold=args.drop_caches)
+        table.add_row(
+            "torf generate", f"{elapsed:.2f}s", f"{size / elapsed / 1e6:.0f}", "-"
+        )
+        for workers in args.workers:
+            elapsed, pieces = run(path, workers, cold=args.drop_caches)
+            table.add_row(
+                f"pptu ({workers} workers)",
+                f"{elapsed:.2f}s",
+                f"{size / elapsed / 1e6:.0f}",
+                "yes" if pieces == reference else "[red]NO[/]",
+            )
+
+        Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
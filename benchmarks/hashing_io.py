@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Compare throughput and page cache pollution of the hashing I/O modes (Linux only).
+
+Usage: python benchmarks/hashing_io.py [PATH] [--size MIB] [--seed-size MIB]
+
+Before every run the data is dropped from the page cache and a separate
+"seeding" file is read into it. After hashing, the table shows how much of
+the hashed data stayed cached and how much of the seeding file was evicted.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ctypes
+import mmap
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+from torf import Torrent
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pptu.hashing import Layout, PieceHasher  # noqa: E402
+from pptu.readers import drop_cache  # noqa: E402
+from pptu.tuning import LOCAL_IO_MODES  # noqa: E402
+
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+
+
+def resident(path: Path) -> int:
+    """Number of bytes of a file currently in the page cache."""
+    size = path.stat().st_size
+    if not size:
+        return 0
+    pages = -(-size // mmap.PAGESIZE)
+    vec = (ctypes.c_ubyte * pages)()
+    with path.open("rb") as fd, mmap.mmap(
+        fd.fileno(), size, access=mmap.ACCESS_COPY
+    ) as mm:
+        addr = ctypes.c_void_p.from_buffer(mm)
+        try:
+            if libc.mincore(ctypes.addressof(addr), size, vec):
+                raise OSError(ctypes.get_errno(), "mincore failed")
+        finally:
+            del addr
+    return sum(x & 1 for x in vec) * mmap.PAGESIZE
+
+
+def evict(files: list[Path]) -> None:
+    for file in files:
+        fd = os.open(file, os.O_RDONLY)
+        try:
+            # Dirty pages can't be dropped before they are written back
+            os.fsync(fd)
+            drop_cache(fd)
+        finally:
+            os.close(fd)
+
+
+def warm(path: Path) -> None:
+    with path.open("rb") as fd:
+        while fd.read(8 * 1024 * 1024):
+            pass
+
+
+def write_random(path: Path, mib: int) -> None:
+    with path.open("wb") as fd:
+        for _ in range(mib):
+            fd.write(os.urandom(1024 * 1024))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=Path, nargs="?")
+    parser.add_argument("--size", type=int, default=1024, help="MiB of test data")
+    parser.add_argument("--seed-size", type=int, default=256, help="MiB of seeding data")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if not path:
+            path = Path(tmp, "release")
+            path.mkdir()
+            write_random(path / "movie.mkv", args.size)
+            for name in ("movie.nfo", "movie.srt", "sample.nfo"):
+                (path / name).write_bytes(os.urandom(30_000))
+        seeding = Path(tmp, "seeding.bin")
+        write_random(seeding, args.seed_size)
+
+        torrent = Torrent(path, private=True)
+        layout = Layout.from_torrent(torrent)
+        files = [x.path for x in layout.files]
+
+        table = Table(title=f"Hashing {layout.size / 1024**2:.0f} MiB")
+        table.add_column("Mode")
+        table.add_column("MB/s", justify="right")
+        table.add_column("Hashed data left in cache", justify="right")
+        table.add_column("Seeding data evicted", justify="right")
+
+        for mode in LOCAL_IO_MODES:
+            evict([*files, seeding])
+            warm(seeding)
+            seeding_before = resident(seeding)
+
+            start = time.perf_counter()
+            PieceHasher(layout, workers=args.workers, io_mode=mode).hash()
+            elapsed = time.perf_counter() - start
+
+            cached = sum(resident(x) for x in files)
+            evicted = seeding_before - resident(seeding)
+            table.add_row(
+                mode,
+                f"{layout.size / elapsed / 1e6:.0f}",
+                f"{cached / 1024**2:.1f} MiB ({cached / layout.size:.0%})",
+                f"{evicted / 1024**2:.1f} MiB",
+            )
+
+        Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
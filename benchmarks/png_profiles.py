@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Compare encode time and size of the PNG optimization profiles.
+
+Usage: python benchmarks/png_profiles.py [PNG ...] [--zopfli ITERATIONS]
+
+Without PNGs, a few 1080p and 4K test frames are generated with ffmpeg.
+Every profile optimizes every frame from memory, the table shows the
+total time and how many bytes were saved compared to the input frames.
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import oxipng
+from rich.console import Console
+from rich.table import Table
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pptu.png import PNG_PROFILES, png_options  # noqa: E402
+
+
+def test_frames(directory: Path) -> list[Path]:
+    frames = []
+    for size in ("1920x1080", "3840x2160"):
+        for source in ("testsrc2", "mandelbrot"):
+            frame = directory / f"{source}_{size}.png"
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-v",
+                    "error",
+                    "-f",
+                    "lavfi",
+                    "-i",
+                    f"{source}=size={size}",
+                    "-frames:v",
+                    "1",
+                    "-compression_level",
+                    "0",
+                    frame,
+                ],
+                check=True,
+            )
+            frames.append(frame)
+    return frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("frames", type=Path, nargs="*", help="PNG frames, e.g. snapshots")
+    parser.add_argument(
+        "--zopfli", type=int, help="also run every profile with Zopfli iterations"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        frames = args.frames or test_frames(Path(tmp))
+        data = [x.read_bytes() for x in frames]
+        total = sum(len(x) for x in data)
+
+        table = Table(title=f"Optimizing {len(data)} frames ({total / 1024**2:.1f} MiB)")
+        table.add_column("Profile")
+        table.add_column("Time", justify="right")
+        table.add_column("Size", justify="right")
+        table.add_column("Saved", justify="right")
+
+        runs = [(x, None) for x in PNG_PROFILES]
+        if args.zopfli:
+            runs += [(x, args.zopfli) for x in PNG_PROFILES]
+        for profile, zopfli in runs:
+            options = png_options(profile, zopfli)
+            start = time.perf_counter()
+            size = sum(len(oxipng.optimize_from_memory(x, **options)) for x in data)
+            elapsed = time.perf_counter() - start
+            table.add_row(
+                profile + (f" + zopfli {zopfli}" if zopfli else ""),
+                f"{elapsed:.2f} s",
+                f"{size / 1024**2:.2f} MiB",
+                f"{(total - size) / 1024**2:.2f} MiB ({(total - size) / total:.0%})",
+            )
+
+        Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable
+
+
+if TYPE_CHECKING:
+    from .hashing import FileEntry
+
+
+# Sidecar format -> algorithm
+CHECKSUM_FORMATS = {"sfv": "crc32", "md5": "md5", "sha256": "sha256"}
+BUFFER_LIMIT = 256 * 1024 * 1024  # Data buffered per file while waiting for an earlier range
+
+
+class Crc32:
+    """CRC32 with the interface of hashlib objects."""
+
+    def __init__(self) -> None:
+        self._crc = 0
+
+    def update(self, data: Any) -> None:
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self) -> str:
+        return f"{self._crc:08X}"
+
+
+def new_digest(algorithm: str) -> Any:
+    return Crc32() if algorithm == "crc32" else hashlib.new(algorithm)
+
+
+class DigestStore:
+    """Persistent per-file checksums, keyed by device, inode, size and mtime."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_digests (key BLOB NOT NULL,"
+            " algorithm TEXT NOT NULL, digest TEXT NOT NULL,"
+            " PRIMARY KEY (key, algorithm))"
+        )
+
+    @staticmethod
+    def key(identity: tuple[int, ...]) -> bytes:
+        return hashlib.sha1(repr(identity).encode()).digest()
+
+    def get(self, identity: tuple[int, ...]) -> dict[str, str]:
+        return dict(
+            self._db.execute(
+                "SELECT algorithm, digest FROM file_digests WHERE key = ?",
+                (self.key(identity),),
+            )
+        )
+
+    def put(self, identity: tuple[int, ...], digests: dict[str, str]) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO file_digests VALUES (?, ?, ?)",
+                [(self.key(identity), *x) for x in digests.items()],
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class _FileState:
+    def __init__(self, algorithms: Iterable[str]):
+        self.digests = {x: new_digest(x) for x in algorithms}
+        self.offset = 0  # Everything before has been hashed
+        self.pending: dict[int, bytes] = {}
+        self.buffered = 0
+        self.cond = threading.Condition()
+
+
+class FileDigests:
+    """
+    Per-file checksums computed from the data read for piece hashing.
+
+    Hashing workers deliver ranges of a file in any order. Ranges ahead of
+    the next expected offset are buffered until the gap before them is
+    filled, so every file is hashed sequentially without reading it again.
+    """
+
+    def __init__(self, algorithms: Iterable[str], store: DigestStore | None = None):
+        self.algorithms = sorted(set(algorithms))
+        self.store = store
+        self.cached: dict[Path, dict[str, str]] = {}
+        self._files: dict[Path, FileEntry] = {}
+        self._state: dict[Path, _FileState] = {}
+        self._aliases: dict[Path, Path] = {}  # Hardlinks of a file that is read
+
+    def prepare(self, files: Iterable[FileEntry]) -> list[FileEntry]:
+        """Return the files that have to be read, the others are taken from the store."""
+        needed = []
+        reading: dict[tuple[int, ...], Path] = {}
+        for file in files:
+            if file.path in self._files:
+                continue
+            self._files[file.path] = file
+            known = self.store.get(file.identity) if self.store else {}
+            if all(x in known for x in self.algorithms):
+                self.cached[file.path] = {x: known[x] for x in self.algorithms}
+            elif file.identity in reading:
+                self._aliases[file.path] = reading[file.identity]
+            else:
+                reading[file.identity] = file.path
+                self._state[file.path] = _FileState(self.algorithms)
+                if file.size:
+                    needed.append(file)
+        return needed
+
+    def wants(self, file: FileEntry) -> bool:
+        return file.path in self._state
+
+    def update(
+        self,
+        file: FileEntry,
+        offset: int,
+        data: Any,
+        stop: threading.Event | None = None,
+    ) -> None:
+        """Feed `data` read from `file` at `offset`, from any thread."""
+        state = self._state[file.path]
+        with state.cond:
+            if offset > state.offset:
+                # Don't run too far ahead of the worker reading the gap
+                while (
+                    state.buffered >= BUFFER_LIMIT
+                    and offset > state.offset
+                    and not (stop and stop.is_set())
+                ):
+                    state.cond.wait(0.5)
+            if offset > state.offset:
+                state.pending[offset] = bytes(data)
+                state.buffered += len(data)
+                return
+            if offset + len(data) <= state.offset:
+                return  # Read again, e.g. for a piece shared with another file
+            self._consume(state, memoryview(data)[state.offset - offset :])
+            while (chunk := state.pending.pop(state.offset, None)) is not None:
+                state.buffered -= len(chunk)
+                self._consume(state, chunk)
+            state.cond.notify_all()
+
+    def result(self) -> dict[Path, dict[str, str]]:
+        """Return the checksums of every complete file and store the new ones."""
+        results = dict(self.cached)
+        for path, state in self._state.items():
+            file = self._files[path]
+            if state.offset != file.size:
+                continue
+            results[path] = {x: y.hexdigest() for x, y in state.digests.items()}
+            if self.store:
+                self.store.put(file.identity, results[path])
+        for path, target in self._aliases.items():
+            if target in results:
+                results[path] = results[target]
+        return results
+
+    @staticmethod
+    def _consume(state: _FileState, data: Any) -> None:
+        for digest in state.digests.values():
+            digest.update(data)
+        state.offset += len(data)
+
+
+def write_sidecars(
+    directory: Path,
+    stem: str,
+    root: Path,
+    formats: Iterable[str],
+    digests: dict[Path, dict[str, str]],
+) -> list[Path]:
+    """Write .sfv/.md5/.sha256 files listing the paths of `digests` relative to `root`."""
+    written = []
+    for fmt in formats:
+        algorithm = CHECKSUM_FORMATS[fmt]
+        lines = []
+        for path in sorted(digests):
+            name = path.relative_to(root).as_posix() if root.is_dir() else path.name
+            if fmt == "sfv":
+                lines.append(f"{name} {digests[path][algorithm]}")
+            else:
+                lines.append(f"{digests[path][algorithm]}  {name}")
+        sidecar = directory / f"{stem}.{fmt}"
+        sidecar.write_text("\n".join(lines) + "\n")
+        written.append(sidecar)
+    return written
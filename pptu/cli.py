@@ -4,22 +4,35 @@ import sys
 import time
 from pathlib import Path
 
+from humanize import naturalsize
 from platformdirs import PlatformDirs
 from rich.console import Console
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TaskProgressColumn, TimeRemainingColumn
 from rich.prompt import Confirm
 from rich.table import Table
+from torf import Torrent
 
 from . import uploaders
 from .constants import PROG_NAME, PROG_VERSION
+from .imagehosts import stats as encoding_stats
+from .ingest import Ingest
+from .library import TorrentIndex
 from .pptu import PPTU
+from .readers import IO_MODES
+from .tuning import PIECE_SIZE, SAMPLE_SIZE, IoBenchmark, TuningStore, settings_grid
 from .uploaders import Uploader
-from .utils import Config, RParse, eprint, print, wprint
+from .utils import Config, CustomTransferSpeedColumn, RParse, as_list, eprint, print, wprint
 
 
 dirs = PlatformDirs(appname="pptu", appauthor=False)
 
 
 def main() -> None:
+    # A release of the same name in the current directory is uploaded, not taken for the command
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS and not Path(sys.argv[1]).exists():
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     parser = RParse(prog=PROG_NAME)
     parser.add_argument(
         "path", type=Path, nargs="*", help="files/directories to create torrents for"
@@ -68,6 +81,19 @@ def main() -> None:
         action="store_true",
         help="disable creating snapshots to description",
     )
+    parser.add_argument(
+        "-io",
+        "--hash-io",
+        metavar="MODE",
+        choices=IO_MODES,
+        help=f"I/O mode for hashing ({', '.join(IO_MODES)})",
+    )
+    parser.add_argument(
+        "-fw",
+        "--follow",
+        action="store_true",
+        help="hash files while they are still being written",
+    )
     parser.add_argument("-s", "--skip-upload", action="store_true", help="skip upload")
     parser.add_argument("-n", "--note", help="note to add to upload")
     parser.add_argument(
@@ -85,11 +111,7 @@ def main() -> None:
 
     config = Config(dirs.user_config_path / "config.toml")
 
-    all_trackers = [
-        x
-        for x in vars(uploaders).values()
-        if isinstance(x, type) and x != Uploader and issubclass(x, Uploader)
-    ]
+    all_trackers = get_all_trackers()
 
     if args.list_trackers:
         supported_trackers = Table(
@@ -108,21 +130,7 @@ def main() -> None:
     if not args.path:
         parser.error("the following arguments are required: path")
 
-    trackers = list()
-    for tracker_name in args.trackers:
-        try:
-            tracker = next(
-                x
-                for x in all_trackers
-                if (
-                    x.name.casefold() == tracker_name.casefold()
-                    or x.abbrev.casefold() == tracker_name.casefold()
-                )
-            )()
-        except StopIteration:
-            eprint(f"Tracker [cyan]{tracker_name}[/] not found.")
-            continue
-        trackers.append(tracker)
+    trackers = get_trackers(args.trackers)
 
     print("[bold green]Logging in to trackers[/]")
     for tracker in trackers:
@@ -158,19 +166,37 @@ def main() -> None:
         )
         cache_dir.mkdir(parents=True, exist_ok=True)
 
-        for tracker in trackers:
-            pptu = PPTU(
+        pptus = [
+            PPTU(
                 path,
                 tracker,
                 note=args.note,
                 auto=args.auto,
                 snapshots=not args.disable_snapshots,
+                hash_io=args.hash_io,
             )
+            for tracker in trackers
+        ]
 
-            print(
-                f"\n[bold green]Creating torrent file for tracker ({tracker.abbrev})[/]"
-            )
-            pptu.create_torrent()
+        if args.follow and pptus:
+            print(f"\n[bold green]Following {path.name}[/]")
+            pptus[0].follow()
+
+        print(
+            "\n[bold green]Creating torrent files for trackers "
+            f"({', '.join(x.abbrev for x in trackers)})[/]"
+        )
+        created = PPTU.create_torrents(pptus)
+        # Extracted once for all trackers, every tracker gets its share
+        ready = [x for x, torrent_created in zip(pptus, created, strict=True) if torrent_created]
+        snapshots_of = dict(zip(ready, PPTU.create_snapshots(ready), strict=True))
+        PPTU.create_thumbnails(ready, [snapshots_of[x] for x in ready])
+
+        for pptu, torrent_created in zip(pptus, created, strict=True):
+            tracker = pptu.tracker
+            if not torrent_created:
+                eprint(f"Creating torrent file for [cyan]{tracker.name}[/] failed.")
+                continue
 
             if tracker.mediainfo:
                 print(f"\n[bold green]Generating MediaInfo ({tracker.abbrev})[/]")
@@ -179,8 +205,7 @@ def main() -> None:
                     continue
                 print("Done!")
 
-            # Generating snapshots
-            snapshots = pptu.generate_snapshots()
+            snapshots = snapshots_of[pptu]
 
             print(f"\n[bold green]Preparing upload ({tracker.abbrev})[/]")
             if not pptu.prepare(mediainfo, snapshots):
@@ -200,6 +225,7 @@ def main() -> None:
                 pptu.upload(mediainfo, snapshots)
 
     if fast_upload:
+        uploaded = []
         for pptu, mediainfo, snapshots in jobs:
             print(f"\n[bold green]Uploading ({pptu.tracker.abbrev})[/]")
             if args.confirm and pptu.tracker.data:
@@ -209,8 +235,201 @@ def main() -> None:
             ):
                 print("Skipping upload")
                 continue
-            pptu.upload(mediainfo, snapshots)
+            if pptu.upload(mediainfo, snapshots, seed=False):
+                uploaded.append(pptu)
             print()
+        # Load everything that finished together in one batch per client
+        PPTU.seed(uploaded)
+
+    if encoding_stats.images:
+        print(
+            f"\n[bold green]Uploaded {encoding_stats.images} images"
+            f" ({naturalsize(encoding_stats.size, binary=True)}), encoding saved"
+            f" {naturalsize(encoding_stats.saved, binary=True)}"
+            f" ({encoding_stats.saved / max(encoding_stats.original_size, 1):.0%})[/]"
+        )
+
+
+def get_all_trackers() -> list[type[Uploader]]:
+    return [
+        x
+        for x in vars(uploaders).values()
+        if isinstance(x, type) and x != Uploader and issubclass(x, Uploader)
+    ]
+
+
+def get_trackers(names: list[str]) -> list[Uploader]:
+    trackers = list()
+    for tracker_name in names:
+        try:
+            tracker = next(
+                x
+                for x in get_all_trackers()
+                if (
+                    x.name.casefold() == tracker_name.casefold()
+                    or x.abbrev.casefold() == tracker_name.casefold()
+                )
+            )()
+        except StopIteration:
+            eprint(f"Tracker [cyan]{tracker_name}[/] not found.")
+            continue
+        trackers.append(tracker)
+    return trackers
+
+
+def index(argv: list[str]) -> None:
+    parser = RParse(prog=f"{PROG_NAME} index")
+    parser.add_argument(
+        "dirs",
+        type=Path,
+        nargs="*",
+        help="directories with .torrent files (default: torrent_dirs from config)",
+    )
+    args = parser.parse_args(argv)
+
+    config = Config(dirs.user_config_path / "config.toml")
+    torrent_dirs = args.dirs or [
+        Path(x) for x in as_list(config.get("default", "torrent_dirs"))
+    ]
+    if not torrent_dirs:
+        eprint("No torrent directories specified or configured.", fatal=True)
+
+    torrent_index = TorrentIndex(dirs.user_cache_path / "index.db")
+    try:
+        with Console().status("Indexing torrents...") as status:
+            updated, removed = torrent_index.scan(
+                torrent_dirs,
+                callback=lambda x: status.update(f"Indexing {x.name}..."),
+            )
+    finally:
+        torrent_index.close()
+    print(f"Indexed [bold cyan]{updated}[/] torrents, removed [bold cyan]{removed}[/]")
+
+
+def ingest(argv: list[str]) -> None:
+    parser = RParse(prog=f"{PROG_NAME} ingest")
+    parser.add_argument("src", type=Path, help="file/directory to copy")
+    parser.add_argument(
+        "dest", type=Path, help="destination path, or existing directory to copy into"
+    )
+    parser.add_argument(
+        "-t",
+        "--trackers",
+        metavar="ABBREV",
+        type=lambda x: x.split(","),
+        required=True,
+        help="tracker(s) to hash for while copying",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.src.exists():
+        eprint(f"File [cyan]{args.src.name!r}[/] does not exist.", fatal=True)
+    dest = args.dest / args.src.name if args.dest.is_dir() else args.dest
+    if dest.exists():
+        eprint(f"Destination [cyan]{str(dest)!r}[/] already exists.", fatal=True)
+
+    config = Config(dirs.user_config_path / "config.toml")
+    trackers = get_trackers(args.trackers)
+    job = Ingest(
+        args.src,
+        dest,
+        [
+            (
+                Torrent(args.src, exclude_regexs=[x.exclude_regexs]),
+                config.get(x, "torrent_version", "v1") != "v1",
+            )
+            for x in trackers
+        ],
+        read_size=config.get("default", "hash_read_size", 4) * 1024**2,
+    )
+
+    print(
+        f"[bold green]Copying and hashing for trackers ({', '.join(x.abbrev for x in trackers)})[/]"
+    )
+    with Progress(
+        BarColumn(),
+        CustomTransferSpeedColumn(),
+        TaskProgressColumn(),
+        TimeRemainingColumn(elapsed_when_finished=True),
+    ) as progress:
+        task = progress.add_task(description="", total=job.size)
+        job.run(lambda _, length: progress.update(task, advance=length))
+
+    if config.get("default", "piece_cache", True):
+        job.store(dirs.user_cache_path / "pieces.db")
+    else:
+        wprint("piece_cache is disabled, hashes of the copy are not kept")
+
+    # The copy is still in the page cache, so MediaInfo is cheap now
+    for tracker in trackers:
+        if tracker.mediainfo:
+            PPTU(dest, tracker).get_mediainfo()
+    print(f"Copied to [cyan]{dest}[/]")
+
+
+def tune_io(argv: list[str]) -> None:
+    parser = RParse(prog=f"{PROG_NAME} tune-io")
+    parser.add_argument(
+        "path", type=Path, help="file/directory with existing data on the device to tune"
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=SAMPLE_SIZE // 1024**2,
+        metavar="MIB",
+        help="MiB hashed per setting (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.path.exists():
+        eprint(f"File [cyan]{args.path.name!r}[/] does not exist.", fatal=True)
+    try:
+        benchmark = IoBenchmark(args.path, sample_size=args.size * 1024**2)
+    except ValueError as e:
+        eprint(str(e), fatal=True)
+
+    grid = settings_grid(args.path)
+    table = Table(
+        title=f"Hashing {benchmark.sample_pieces * PIECE_SIZE / 1024**2:.0f} MiB per setting"
+    )
+    table.add_column("I/O mode")
+    table.add_column("Workers", justify="right")
+    table.add_column("Read size", justify="right")
+    table.add_column("Prefetch", justify="right")
+    table.add_column("MB/s", justify="right")
+
+    best = None
+    with Progress(
+        BarColumn(), MofNCompleteColumn(), TimeRemainingColumn(elapsed_when_finished=True)
+    ) as progress:
+        task = progress.add_task(description="", total=len(grid))
+        for settings, throughput in benchmark.run(grid):
+            progress.update(task, advance=1)
+            table.add_row(
+                settings.io_mode,
+                str(settings.workers),
+                f"{settings.read_size // 1024**2} MiB",
+                str(settings.prefetch) if settings.io_mode == "network" else "-",
+                f"{throughput / 1e6:.0f}",
+            )
+            if not best or throughput > best[1]:
+                best = (settings, throughput)
+
+    Console().print(table)
+    if best:
+        TuningStore(dirs.user_cache_path / "io_profiles.json").put(args.path, *best)
+        print(
+            f"Using [bold cyan]{best[0].io_mode}[/] mode, [bold cyan]{best[0].workers}[/] workers"
+            f" and [bold cyan]{best[0].read_size // 1024**2} MiB[/] reads for this device"
+            f" ([bold cyan]{best[1] / 1e6:.0f} MB/s[/])"
+        )
+
+
+COMMANDS = {
+    "index": index,
+    "ingest": ingest,
+    "tune-io": tune_io,
+}
 
 
 if __name__ == "__main__":
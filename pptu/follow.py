@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import ctypes
+import hashlib
+import os
+import random
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Callable
+
+from torf import Torrent
+
+from .hashing import Checkpoint, FileEntry, Layout, PieceHasher, PieceStore, StreamHasher
+from .readers import READ_SIZE, Reader, is_network_path, pread, short_read
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+EVENT = struct.Struct("iIII")  # inotify_event without the name
+CANDIDATES = 3  # Piece sizes hashed in parallel, as the final size isn't known yet
+HEAD_SIZE = 16 * 1024 * 1024  # Muxers patch their headers when finishing, rehashed at the end
+VERIFY_PIECES = 3  # Random pieces rehashed to catch writers that didn't just append
+
+
+def piece_sizes(size: int) -> list[int]:
+    """Piece sizes torf may pick once a file that's now `size` bytes is finished."""
+    piece_size = Torrent.calculate_piece_size(max(size, 1))
+    return [
+        piece_size << i
+        for i in range(CANDIDATES)
+        if piece_size << i <= Torrent.piece_size_max_default
+    ]
+
+
+class Watcher:
+    """
+    Wait for writes to a file with inotify, or by polling its size and mtime.
+
+    inotify doesn't see writes from other hosts, so files on network
+    filesystems are always polled.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd = -1
+        self._last = self._stat()
+        if is_network_path(path):
+            return
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        if libc.inotify_add_watch(fd, os.fsencode(path), IN_MODIFY | IN_CLOSE_WRITE) < 0:
+            os.close(fd)
+            return
+        self._fd = fd
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def wait(self, timeout: float) -> tuple[bool, bool]:
+        """Wait up to `timeout` seconds, return whether the file was modified and closed."""
+        if self._fd < 0:
+            time.sleep(timeout)
+            stat = self._stat()
+            modified, self._last = stat != self._last, stat
+            return modified, False
+
+        modified = closed = False
+        if select.select([self._fd], [], [], timeout)[0]:
+            data = os.read(self._fd, 64 * 1024)
+            pos = 0
+            while pos < len(data):
+                _, mask, _, length = EVENT.unpack_from(data, pos)
+                pos += EVENT.size + length
+                modified |= bool(mask & IN_MODIFY)
+                closed |= bool(mask & IN_CLOSE_WRITE)
+        return modified, closed
+
+    def _stat(self) -> tuple[int, int]:
+        st = os.stat(self.path)
+        return st.st_size, st.st_mtime_ns
+
+
+class Follower:
+    """
+    Hash a file while it's being written, for every piece size it may end up with.
+
+    Complete pieces are hashed as the file grows and checkpointed, so an
+    interrupted follow resumes where it stopped. Once the writer closed the
+    file, or it hasn't changed for `idle` seconds, the tail is hashed, the head
+    and a few random pieces are hashed again, and the hashes are stored under
+    the file's final identity.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        cache_dir: Path,
+        *,
+        read_size: int = READ_SIZE,
+        idle: float = 30,
+        settle: float = 2,
+    ):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.read_size = read_size
+        self.idle = idle
+        self.settle = settle
+
+        st = os.stat(path)
+        self._prefix = hashlib.sha1(repr((st.st_dev, st.st_ino)).encode()).hexdigest()[:16]
+        # Only positions the data fed to the stream hashers, the file keeps changing
+        self._entry = FileEntry(path, 0, 0, (st.st_dev, st.st_ino, 0, 0))
+        self._hashers: dict[int, StreamHasher] = {}
+        self._checkpoints: dict[int, Checkpoint] = {}
+        self._fed: dict[int, int] = {}  # Bytes fed to the hasher of every piece size
+
+    def run(self, callback: Callable[[Path, int], None] | None = None) -> None:
+        """Hash the file until it's complete."""
+        watcher = Watcher(self.path)
+        try:
+            st = os.stat(self.path)
+            # A file nobody is writing to is complete after the first pass
+            quiet_since = time.monotonic() - max(0, time.time() - st.st_mtime)
+            closed = False
+            while True:
+                size = os.stat(self.path).st_size
+                if self._fed and size < max(self._fed.values()):
+                    self._reset()  # Truncated, the writer started over
+                self._update_candidates(size)
+                self._feed(size, callback)
+
+                modified, was_closed = watcher.wait(1)
+                now = time.monotonic()
+                if modified or os.stat(self.path).st_size != size:
+                    quiet_since = now
+                    closed = False
+                closed |= was_closed
+                quiet = now - quiet_since
+                if (closed and quiet >= self.settle) or quiet >= self.idle:
+                    break
+        finally:
+            watcher.close()
+            for checkpoint in self._checkpoints.values():
+                checkpoint.flush()
+
+    def store(self, store: PieceStore, workers: int | None = None) -> bool:
+        """
+        Store the hashes for the piece size of the complete file.
+
+        Returns False if they can't be trusted, e.g. because the file was
+        preallocated and written out of order, the file then has to be hashed
+        normally.
+        """
+        size = os.stat(self.path).st_size
+        layout = Layout([self.path], Torrent.calculate_piece_size(max(size, 1)))
+        try:
+            if not (hasher := self._hashers.get(layout.piece_size)):
+                return False
+            self._feed(size)
+            hashes = hasher.finish()
+            if len(hashes) != layout.pieces:
+                return False
+
+            head = set(range(min(layout.pieces, -(-HEAD_SIZE // layout.piece_size))))
+            rest = sorted(set(hashes) - head)
+            sample = random.sample(rest, min(VERIFY_PIECES, len(rest)))
+            fresh = PieceHasher(layout, workers=workers).hash(sorted(head | set(sample)))
+            if any(fresh[x] != hashes[x] for x in sample):
+                return False
+            hashes.update(fresh)
+
+            store.put(
+                (PieceStore.key(layout, piece), digest) for piece, digest in hashes.items()
+            )
+            return True
+        finally:
+            self._reset()
+
+    def _update_candidates(self, size: int) -> None:
+        wanted = piece_sizes(size)
+        for piece_size in list(self._hashers):
+            # Piece sizes only grow with the file
+            if piece_size < wanted[0]:
+                self._checkpoints.pop(piece_size).remove()
+                del self._hashers[piece_size], self._fed[piece_size]
+
+        for piece_size in wanted:
+            if piece_size in self._hashers:
+                continue
+            checkpoint = Checkpoint(
+                self.cache_dir / f"follow_{self._prefix}_{piece_size}.checkpoint"
+            )
+            hasher = StreamHasher(Layout([], piece_size), on_piece=checkpoint.add)
+            # Resume after the pieces finished before, as long as they're contiguous
+            done = checkpoint.load()
+            fed = 0
+            while fed // piece_size in done and fed + piece_size <= size:
+                hasher.hashes[fed // piece_size] = done[fed // piece_size]
+                fed += piece_size
+            self._hashers[piece_size] = hasher
+            self._checkpoints[piece_size] = checkpoint
+            self._fed[piece_size] = fed
+
+    def _feed(self, end: int, callback: Callable[[Path, int], None] | None = None) -> None:
+        if not self._fed or (offset := min(self._fed.values())) >= end:
+            return
+        fd = os.open(self.path, Reader.flags)
+        try:
+            while offset < end:
+                data = pread(fd, min(self.read_size, end - offset), offset)
+                if not data:
+                    raise short_read(self.path)
+                for piece_size, hasher in self._hashers.items():
+                    # Piece sizes added later catch up from the start
+                    if (skip := self._fed[piece_size] - offset) < len(data):
+                        hasher.update(
+                            self._entry, offset + max(skip, 0), memoryview(data)[max(skip, 0) :]
+                        )
+                        self._fed[piece_size] = offset + len(data)
+                offset += len(data)
+                if callback:
+                    callback(self.path, len(data))
+        finally:
+            os.close(fd)
+
+    def _reset(self) -> None:
+        for checkpoint in self._checkpoints.values():
+            checkpoint.remove()
+        self._hashers.clear()
+        self._checkpoints.clear()
+        self._fed.clear()
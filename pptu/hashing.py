@@ -0,0 +1,602 @@
+from __future__ import annotations
+
+import bisect
+import hashlib
+import os
+import random
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, NamedTuple
+
+from .readers import PREFETCH_DEPTH, READ_SIZE, make_reader, read_small_files
+
+
+if TYPE_CHECKING:
+    from torf import Torrent
+
+    from .checksums import FileDigests
+
+
+DEFAULT_HASH_WORKERS = min(4, os.cpu_count() or 1)
+JOB_SIZE = 64 * 1024 * 1024  # Minimum number of bytes hashed by a worker in one go
+CHECKPOINT_INTERVAL = 10  # Seconds between writing finished pieces to the checkpoint
+
+
+class FileEntry(NamedTuple):
+    path: Path
+    offset: int  # Offset of the file in the torrent's byte stream
+    size: int
+    identity: tuple[int, int, int, int]  # Device, inode, size and mtime of the file
+
+
+class Layout:
+    """
+    Files of a torrent laid out as one continuous byte stream, split into pieces.
+
+    With `aligned`, every file starts on a piece boundary like in BitTorrent v2,
+    the gaps are not backed by any file.
+    """
+
+    def __init__(
+        self, paths: Iterable[str | Path], piece_size: int, *, aligned: bool = False
+    ):
+        self.piece_size = piece_size
+        self.files: list[FileEntry] = []
+
+        offset = 0
+        for path in paths:
+            if aligned:
+                offset = -(-offset // piece_size) * piece_size
+            st = os.stat(path)
+            self.files.append(
+                FileEntry(
+                    Path(path),
+                    offset,
+                    st.st_size,
+                    (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns),
+                )
+            )
+            offset += st.st_size
+
+        self.size = offset
+        self.pieces = -(-self.size // self.piece_size)
+        self._offsets = [file.offset for file in self.files]
+
+    @classmethod
+    def from_torrent(cls, torrent: Torrent) -> Layout:
+        return cls(torrent.filepaths, torrent.piece_size)
+
+    def segments(self, piece: int) -> list[tuple[FileEntry, int, int]]:
+        """Return (file, offset in file, length) tuples making up a piece."""
+        start = piece * self.piece_size
+        end = min(start + self.piece_size, self.size)
+
+        segments = []
+        for file in self.files[max(0, bisect.bisect_right(self._offsets, start) - 1):]:
+            if file.offset + file.size <= start or not file.size:
+                continue
+            if file.offset >= end:
+                break
+            seg_start = max(start, file.offset)
+            seg_end = min(end, file.offset + file.size)
+            segments.append((file, seg_start - file.offset, seg_end - seg_start))
+
+        return segments
+
+
+class PieceHasher:
+    """
+    Hash the pieces of a layout with a pool of worker threads.
+
+    The piece range is split into contiguous jobs, each worker reads its job
+    with positional reads so no file offsets are shared between threads.
+    SHA-1 releases the GIL, so threads scale until the disk becomes the limit.
+    Data of the files wanted by `digests` is fed to it as well.
+    """
+
+    def __init__(
+        self,
+        layout: Layout,
+        *,
+        workers: int | None = None,
+        io_mode: str = "buffered",
+        read_size: int = READ_SIZE,
+        prefetch: int = PREFETCH_DEPTH,
+        hash_factory: Callable[[], Any] = hashlib.sha1,
+        callback: Callable[[Path, int], None] | None = None,
+        on_piece: Callable[[int, bytes], None] | None = None,
+        digests: FileDigests | None = None,
+    ):
+        self.layout = layout
+        self.workers = max(1, workers or DEFAULT_HASH_WORKERS)
+        self.hash_factory = hash_factory
+        self.io_mode = io_mode
+        self.read_size = read_size
+        self.prefetch = prefetch
+        self.callback = callback
+        self.on_piece = on_piece
+        self.digests = digests
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def jobs(self, pieces: Iterable[int]) -> list[list[int]]:
+        """Split pieces into runs of consecutive pieces, each at most JOB_SIZE long."""
+        pieces_per_job = max(1, JOB_SIZE // self.layout.piece_size)
+        jobs: list[list[int]] = []
+        for piece in sorted(pieces):
+            if jobs and jobs[-1][-1] == piece - 1 and len(jobs[-1]) < pieces_per_job:
+                jobs[-1].append(piece)
+            else:
+                jobs.append([piece])
+        return jobs
+
+    def hash(self, pieces: Iterable[int] | None = None) -> dict[int, bytes]:
+        """Hash the given pieces (all of them by default)."""
+        if pieces is None:
+            pieces = range(self.layout.pieces)
+        jobs = self.jobs(pieces)
+
+        small_files = read_small_files(
+            (file for job in jobs for x in job for file, _, _ in self.layout.segments(x)),
+            self.io_mode,
+        )
+
+        hashes: dict[int, bytes] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                pool.submit(self._hash_job, job, hashes, small_files) for job in jobs
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Don't wait for the remaining jobs on errors or Ctrl-C
+                self._stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return hashes
+
+    def _hash_job(
+        self, job: list[int], hashes: dict[int, bytes], small_files: dict[Path, bytes]
+    ) -> None:
+        with make_reader(
+            self.io_mode, self.read_size, small_files, prefetch=self.prefetch
+        ) as reader:
+            reader.plan(x for piece in job for x in self.layout.segments(piece))
+            for piece in job:
+                if self._stop.is_set():
+                    return
+                hasher = self.hash_factory()
+                for file, offset, length in self.layout.segments(piece):
+                    update = hasher.update
+                    if self.digests and self.digests.wants(file):
+                        update = self._tee(hasher.update, file, offset)
+                    reader.read_into(update, file, offset, length)
+                    if self.callback:
+                        with self._lock:
+                            self.callback(file.path, length)
+                hashes[piece] = hasher.digest()
+                if self.on_piece:
+                    with self._lock:
+                        self.on_piece(piece, hashes[piece])
+
+    def _tee(
+        self, update: Callable[[Any], None], file: FileEntry, offset: int
+    ) -> Callable[[Any], None]:
+        """Feed the data of a segment to `update` and to the file digests."""
+        position = offset
+
+        def tee(data: Any) -> None:
+            nonlocal position
+            update(data)
+            self.digests.update(file, position, data, self._stop)  # type: ignore[union-attr]
+            position += len(data)
+
+        return tee
+
+
+class StreamHasher:
+    """
+    Hash the pieces of a layout from data fed in order, e.g. while copying.
+
+    Every file has to be fed from start to end. Files of an aligned layout
+    may come in any order, as none of their pieces span files.
+    """
+
+    def __init__(
+        self,
+        layout: Layout,
+        hash_factory: Callable[[], Any] = hashlib.sha1,
+        on_piece: Callable[[int, bytes], None] | None = None,
+    ):
+        self.layout = layout
+        self.hash_factory = hash_factory
+        self.on_piece = on_piece
+        self.hashes: dict[int, bytes] = {}
+        self._piece = -1
+        self._hasher: Any = None
+
+    def update(self, file: FileEntry, offset: int, data: Any) -> None:
+        """Feed `data` read from `file` at `offset`."""
+        piece_size = self.layout.piece_size
+        position = file.offset + offset
+        view = memoryview(data)
+        while view:
+            piece = position // piece_size
+            if piece != self._piece:
+                self._finish()
+                self._piece = piece
+                self._hasher = self.hash_factory()
+            length = min(len(view), (piece + 1) * piece_size - position)
+            self._hasher.update(view[:length])
+            view = view[length:]
+            position += length
+            if position % piece_size == 0:
+                self._finish()
+
+    def finish(self) -> dict[int, bytes]:
+        self._finish()
+        return self.hashes
+
+    def _finish(self) -> None:
+        if self._hasher is not None:
+            self.hashes[self._piece] = self._hasher.digest()
+            self._hasher = None
+            if self.on_piece:
+                self.on_piece(self._piece, self.hashes[self._piece])
+
+
+class PieceStore:
+    """
+    Persistent piece hashes, keyed by the identity of the data they cover.
+
+    A key is made of the piece size and the device, inode, size and mtime of
+    every file a piece overlaps together with the offsets read from them.
+    Path names are not part of the key, so hardlinked copies share the hashes
+    of pieces covering the same offsets, and a changed file only invalidates
+    the pieces overlapping it.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pieces"
+            " (key BLOB PRIMARY KEY, hash BLOB NOT NULL)"
+        )
+
+    @staticmethod
+    def key(layout: Layout, piece: int) -> bytes:
+        key = hashlib.sha1(str(layout.piece_size).encode())
+        for file, offset, length in layout.segments(piece):
+            key.update(repr((file.identity, offset, length)).encode())
+        return key.digest()
+
+    def get(self, keys: Iterable[bytes]) -> dict[bytes, bytes]:
+        keys = list(keys)
+        found: dict[bytes, bytes] = {}
+        # Stay below SQLite's default limit of host parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(
+                self._db.execute(
+                    f"SELECT key, hash FROM pieces WHERE key IN ({placeholders})",
+                    chunk,
+                )
+            )
+        return found
+
+    def put(self, items: Iterable[tuple[bytes, bytes]]) -> None:
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO pieces VALUES (?, ?)", items)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class Checkpoint:
+    """
+    Append-only file of finished piece hashes, used to resume interrupted hashing.
+
+    The file name is derived from the piece size and the identity of every
+    file in the layout, so a checkpoint is only picked up for the same data.
+    """
+
+    RECORD = struct.Struct(">I20s")  # Piece index and SHA-1 digest
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._pending: list[tuple[int, bytes]] = []
+        self._last_flush = time.monotonic()
+
+    @classmethod
+    def for_layout(cls, cache_dir: Path, layout: Layout) -> Checkpoint:
+        fingerprint = hashlib.sha1(str(layout.piece_size).encode())
+        for file in layout.files:
+            fingerprint.update(repr((file.offset, file.identity)).encode())
+        return cls(cache_dir / f"pieces_{fingerprint.hexdigest()[:16]}.checkpoint")
+
+    def load(self) -> dict[int, bytes]:
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            return {}
+
+        # Drop a record torn by a crash, so new records stay aligned
+        usable = len(data) - len(data) % self.RECORD.size
+        if usable != len(data):
+            os.truncate(self.path, usable)
+
+        return dict(self.RECORD.iter_unpack(data[:usable]))
+
+    def add(self, piece: int, digest: bytes) -> None:
+        self._pending.append((piece, digest))
+        if time.monotonic() - self._last_flush >= CHECKPOINT_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        with self.path.open("ab") as fd:
+            fd.write(b"".join(self.RECORD.pack(*x) for x in self._pending))
+            fd.flush()
+            os.fsync(fd.fileno())
+        self._pending.clear()
+
+    def remove(self) -> None:
+        self._pending.clear()
+        self.path.unlink(missing_ok=True)
+
+
+class TorrentHasher:
+    """
+    Hash the pieces of a torrent, reusing whatever the piece store already knows.
+
+    Pieces with the same key are only hashed once. Hardlinked copies within
+    a release are only skipped where their pieces line up with the first
+    copy, e.g. in aligned layouts. Files still missing from `digests` are
+    read in full, even where their pieces are cached.
+    """
+
+    def __init__(
+        self,
+        torrent: Torrent,
+        *,
+        workers: int | None = None,
+        store: PieceStore | None = None,
+        checkpoint_dir: Path | None = None,
+        io_mode: str = "buffered",
+        read_size: int = READ_SIZE,
+        prefetch: int = PREFETCH_DEPTH,
+        digests: FileDigests | None = None,
+    ):
+        self.torrent = torrent
+        self.layout = Layout.from_torrent(torrent)
+        self.workers = workers
+        self.io_mode = io_mode
+        self.read_size = read_size
+        self.prefetch = prefetch
+        self.store = store
+        self.digests = digests
+        self.digest_files = digests.prepare(self.layout.files) if digests else []
+        self.checkpoint = (
+            Checkpoint.for_layout(checkpoint_dir, self.layout) if checkpoint_dir else None
+        )
+
+        self.keys = [
+            PieceStore.key(self.layout, i) for i in range(self.layout.pieces)
+        ]
+        self.hashes: dict[bytes, bytes] = store.get(set(self.keys)) if store else {}
+        self._stored = set(self.hashes)
+        self._new: dict[bytes, bytes] = {}
+
+        # Pieces finished by an interrupted run
+        self.resumed = 0
+        if self.checkpoint:
+            for piece, digest in self.checkpoint.load().items():
+                if piece < self.layout.pieces and self.keys[piece] not in self.hashes:
+                    self._new[self.keys[piece]] = digest
+                    self.hashes[self.keys[piece]] = digest
+                    self.resumed += 1
+
+        self.missing = self._find_missing()
+
+    def _find_missing(self) -> dict[bytes, int]:
+        # Hash the first piece of every unknown key only
+        missing: dict[bytes, int] = {}
+        for piece, key in enumerate(self.keys):
+            if key not in self.hashes:
+                missing.setdefault(key, piece)
+        return missing
+
+    @property
+    def cached(self) -> int:
+        """Number of pieces not requiring a read."""
+        return self.layout.pieces - len(self.missing)
+
+    def _to_read(self) -> set[int]:
+        """Return the pieces to read, including those only needed for file digests."""
+        pieces = set(self.missing.values())
+        piece_size = self.layout.piece_size
+        for file in self.digest_files:
+            pieces.update(
+                range(
+                    file.offset // piece_size,
+                    (file.offset + file.size - 1) // piece_size + 1,
+                )
+            )
+        return pieces
+
+    @property
+    def pending(self) -> int:
+        """Number of bytes that have to be read."""
+        return sum(
+            length
+            for piece in self._to_read()
+            for _, _, length in self.layout.segments(piece)
+        )
+
+    def _sample_hasher(self) -> PieceHasher:
+        return PieceHasher(
+            self.layout,
+            workers=self.workers,
+            io_mode=self.io_mode,
+            read_size=self.read_size,
+            prefetch=self.prefetch,
+        )
+
+    def verify(self, samples: int = 3) -> bool:
+        """
+        Rehash a few random pieces taken from the store, drop all of them on a mismatch.
+
+        The store only notices changed files by their size and mtime, content
+        changed with the mtime kept (e.g. by `cp -p` or `rsync -t`) isn't.
+        """
+        stored: dict[bytes, int] = {}
+        for piece, key in enumerate(self.keys):
+            if key in self._stored:
+                stored.setdefault(key, piece)
+        sample = random.sample(sorted(stored.values()), min(samples, len(stored)))
+        if all(
+            self.hashes[self.keys[x]] == digest
+            for x, digest in self._sample_hasher().hash(sample).items()
+        ):
+            return True
+
+        for key in self._stored:
+            del self.hashes[key]
+        self._stored.clear()
+        self.missing = self._find_missing()
+        return False
+
+    def reuse(self, candidates: Iterable[dict[int, bytes]], samples: int = 3) -> int:
+        """
+        Take piece hashes from other torrents describing the same data.
+
+        A few random pieces of every candidate are hashed first, a single
+        mismatch rejects the candidate. Returns the number of reused pieces.
+        """
+        hasher = self._sample_hasher()
+        reused = 0
+        for pieces in candidates:
+            pieces = {
+                piece: digest
+                for piece, digest in pieces.items()
+                if self.keys[piece] not in self.hashes
+            }
+            if not pieces:
+                continue
+            sample = random.sample(sorted(pieces), min(samples, len(pieces)))
+            if any(pieces[x] != digest for x, digest in hasher.hash(sample).items()):
+                continue
+            for piece, digest in pieces.items():
+                if self.keys[piece] not in self.hashes:
+                    self._new[self.keys[piece]] = digest
+                    self.hashes[self.keys[piece]] = digest
+                    reused += 1
+
+        self.missing = self._find_missing()
+        return reused
+
+    def run(self, callback: Callable[[Path, int], None] | None = None) -> None:
+        hasher = PieceHasher(
+            self.layout,
+            workers=self.workers,
+            io_mode=self.io_mode,
+            read_size=self.read_size,
+            prefetch=self.prefetch,
+            callback=callback,
+            on_piece=self._on_piece,
+            digests=self.digests,
+        )
+        try:
+            hasher.hash(self._to_read())
+        finally:
+            # Keep everything finished so far, even when interrupted. The checkpoint
+            # goes first, it's still there when the store can't be written.
+            if self.checkpoint:
+                self.checkpoint.flush()
+            if self.store:
+                self.store.put(self._new.items())
+        if self.checkpoint:
+            self.checkpoint.remove()
+
+        self.torrent.metainfo["info"]["pieces"] = b"".join(
+            self.hashes[key] for key in self.keys
+        )
+
+    def _on_piece(self, piece: int, digest: bytes) -> None:
+        self._new[self.keys[piece]] = digest
+        self.hashes[self.keys[piece]] = digest
+        if self.checkpoint:
+            self.checkpoint.add(piece, digest)
+
+
+def fast_resume(layout: Layout) -> dict[str, Any]:
+    """Return rtorrent's resume data for a layout with all pieces complete, like `Metafile.add_fast_resume`."""
+    piece_size = layout.piece_size
+    return {
+        "bitfield": layout.pieces,
+        "files": [
+            {
+                "priority": 1,
+                "mtime": file.identity[3] // 10**9,
+                "completed": -(-(file.offset + file.size) // piece_size)
+                - file.offset // piece_size,
+            }
+            for file in layout.files
+        ],
+    }
+
+
+def verify_pieces(
+    hasher: PieceHasher,
+    pieces: bytes,
+    *,
+    samples: int = 3,
+    changed_since: int | None = None,
+) -> bool:
+    """
+    Check piece hashes of a cached torrent against the files.
+
+    A few random pieces are rehashed, together with every piece overlapping
+    a file modified after `changed_since` (in nanoseconds since the epoch).
+    """
+    layout = hasher.layout
+    if len(pieces) != layout.pieces * 20:
+        return False
+
+    check = set(random.sample(range(layout.pieces), min(samples, layout.pieces)))
+    if changed_since is not None:
+        for file in layout.files:
+            if file.size and file.identity[3] > changed_since:
+                check.update(
+                    range(
+                        file.offset // layout.piece_size,
+                        (file.offset + file.size - 1) // layout.piece_size + 1,
+                    )
+                )
+
+    return all(
+        pieces[piece * 20 : (piece + 1) * 20] == digest
+        for piece, digest in hasher.hash(check).items()
+    )
+
+
+def hash_torrent(
+    torrent: Torrent,
+    *,
+    workers: int | None = None,
+    store: PieceStore | None = None,
+    callback: Callable[[Path, int], None] | None = None,
+) -> None:
+    """Hash all pieces of a torrent, the result is identical to `Torrent.generate`."""
+    TorrentHasher(torrent, workers=workers, store=store).run(callback)
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+import humanize
+from rich.console import Console
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TaskProgressColumn, TextColumn, TimeRemainingColumn
+from wand.image import Image
+from wand.version import formats as wand_formats
+
+from .snapshots import DEFAULT_SNAPSHOT_WORKERS
+from .thumbnails import snapshot_hash
+from .utils import eprint, wprint, write_atomic
+
+
+if TYPE_CHECKING:
+    from .uploaders import Uploader
+
+
+class HostCapabilities(NamedTuple):
+    formats: tuple[str, ...]  # Formats accepted by the host and displayed by browsers
+    max_size: int | None = None  # Bytes per image, None when the host doesn't publish a limit
+
+
+# Limits that aren't published are left to the img_max_size config. AVIF isn't
+# lossless and few browsers display JPEG XL, both only used with img_formats.
+IMAGE_HOSTS = {
+    "keksh": HostCapabilities(("webp", "png")),
+    "ptpimg": HostCapabilities(("png",)),
+    "hdbimg": HostCapabilities(("png",)),
+}
+IMAGE_FORMATS = ("jxl", "webp", "avif", "png")
+
+
+class Encoded(NamedTuple):
+    path: Path
+    size: int
+    original_size: int
+
+
+class EncodingStats:
+    """Bytes of snapshots uploaded in the current run, and what encoding saved."""
+
+    def __init__(self) -> None:
+        self.images = 0
+        self.original_size = 0
+        self.size = 0
+
+    def add(self, images: list[Encoded]) -> None:
+        self.images += len(images)
+        self.original_size += sum(x.original_size for x in images)
+        self.size += sum(x.size for x in images)
+
+    @property
+    def saved(self) -> int:
+        return self.original_size - self.size
+
+
+stats = EncodingStats()
+
+
+def supported_formats() -> set[str]:
+    """Return the formats the installed ImageMagick can write, PNG always included."""
+    return {"png", *(x.lower() for x in wand_formats() if x.lower() in IMAGE_FORMATS)}
+
+
+def encode(img: Image, file_type: str) -> bytes:
+    """Encode an image losslessly, AVIF at the highest quality without chroma subsampling."""
+    with img.clone() as out:
+        if file_type == "webp":
+            out.options["webp:lossless"] = "true"
+            out.options["webp:method"] = "6"
+        elif file_type == "avif":
+            out.compression_quality = 100
+            out.options["heic:chroma"] = "444"
+        elif file_type == "jxl":
+            # Quality 100 is lossless modular mode
+            out.compression_quality = 100
+        data: bytes = out.make_blob(file_type)
+        return data
+
+
+def encode_image(snapshot: Path, formats: list[str], directory: Path) -> Encoded:
+    """
+    Encode a PNG snapshot in every format and keep the smallest one.
+
+    Encoded images are cached in `directory` by the hash of the snapshot,
+    only the formats not tried before are encoded.
+    """
+    original_size = snapshot.stat().st_size
+    digest = snapshot_hash(snapshot)
+    candidates = {snapshot: original_size}
+    missing = []
+    for file_type in formats:
+        path = directory / f"{digest[:32]}.{file_type}"
+        if path.exists():
+            candidates[path] = path.stat().st_size
+        elif file_type != "png":
+            missing.append((file_type, path))
+
+    if missing:
+        with Image(filename=snapshot) as img:
+            for file_type, path in missing:
+                data = encode(img, file_type)
+                write_atomic(path, data)
+                candidates[path] = len(data)
+
+    path = min(candidates, key=lambda x: candidates[x])
+    return Encoded(path, candidates[path], original_size)
+
+
+def encode_for_host(
+    snapshots: list[Path],
+    capabilities: HostCapabilities,
+    directory: Path,
+    *,
+    workers: int | None = None,
+) -> list[Encoded]:
+    """Encode snapshots into the smallest format the host accepts, on a pool of threads."""
+    supported = supported_formats()
+    # The PNG snapshot itself is always a candidate
+    formats = [x for x in dict.fromkeys(capabilities.formats) if x in supported]
+    directory.mkdir(parents=True, exist_ok=True)
+
+    def encode_one(snapshot: Path) -> Encoded:
+        if snapshot.suffix.lower() != ".png" or not set(formats) - {"png"}:
+            size = snapshot.stat().st_size
+            return Encoded(snapshot, size, size)
+        return encode_image(snapshot, formats, directory)
+
+    workers = max(1, workers or DEFAULT_SNAPSHOT_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(encode_one, snapshots))
+
+
+class Img:
+    def __init__(self, tracker: Uploader):
+        self.tracker = tracker
+        self.uploader = tracker.config.get(tracker, "img_uploader")
+        key_ = f"{self.uploader}_api_key"
+        self.api_key = (
+            tracker.config.get("img_uploaders", key_, None)
+            or os.environ.get(key_.upper())
+            or None
+        )
+
+    def hdbimg(
+        self, files: list[Path], thumbnail_width: int = 220, name: str = ""
+    ) -> list[Any | None] | None:
+        with Console().status(
+            "Uploading snapshots..."
+        ), contextlib.ExitStack() as stack:
+            r = self.tracker.session.post(
+                url="https://img.hdbits.org/upload_api.php",
+                files={
+                    **{
+                        f"images_files[{i}]": stack.enter_context(  # type: ignore[misc]
+                            snap.open("rb")
+                        )
+                        for i, snap in enumerate(files)
+                    },
+                    "thumbsize": f"w{thumbnail_width}",
+                    "galleryoption": "1",
+                    "galleryname": name,
+                },
+                timeout=60,
+            )
+        res = r.text
+        if res.startswith("error"):
+            error = re.sub(r"^error: ", "", res)
+            eprint(f"Snapshot upload failed: [cyan]{error}[/cyan]")
+            return []
+
+        return res.split()
+
+    def keksh(self, files: list[Path]) -> list[dict[Any, Any] | None] | None:
+        res = []
+        headers = dict()
+
+        if self.api_key:
+            headers = {"x-kek-auth": self.api_key}
+
+        with Progress(
+            TextColumn("[progress.description]{task.description}[/]"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TaskProgressColumn(),
+            TimeRemainingColumn(elapsed_when_finished=True),
+        ) as progress:
+            for snap in progress.track(files, description="Uploading snapshots"):
+                with open(snap, "rb") as fd:
+                    r = self.tracker.session.post(
+                        url="https://kek.sh/api/v1/posts",
+                        headers=headers,
+                        files={
+                            "file": fd,
+                        },
+                        timeout=60,
+                    )
+                    r.raise_for_status()
+                    res.append(r.json())
+
+        return res
+
+    def ptpimg(self, files: list[Path]) -> list[dict[Any, Any] | None] | None:
+        res = []
+
+        with Progress(
+            TextColumn("[progress.description]{task.description}[/]"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TaskProgressColumn(),
+            TimeRemainingColumn(elapsed_when_finished=True),
+        ) as progress:
+            for snap in progress.track(files, description="Uploading snapshots"):
+                with open(snap, "rb") as fd:
+                    r = self.tracker.session.post(
+                        url="https://ptpimg.me/upload.php",
+                        files={
+                            "file-upload[]": fd,
+                        },
+                        data={
+                            "api_key": self.api_key,
+                        },
+                        headers={
+                            "Referer": "https://ptpimg.me/index.php",
+                        },
+                        timeout=60,
+                    )
+                    r.raise_for_status()
+                    res.append(r.json())
+
+        return res
+
+    def encode(self, files: list[Path]) -> list[Path] | None:
+        """
+        Encode files into the smallest format the host accepts.
+
+        Every file is checked against the host's size limit before anything
+        is uploaded, None is returned if any of them is too large.
+        """
+        capabilities = IMAGE_HOSTS[self.uploader]
+        if formats := self.tracker.config.get(self.tracker, "img_formats"):
+            capabilities = capabilities._replace(formats=tuple(formats))
+        if max_size := self.tracker.config.get(self.tracker, "img_max_size"):
+            capabilities = capabilities._replace(max_size=int(max_size * 1024**2))
+
+        with Console().status("Encoding snapshots..."):
+            encoded = encode_for_host(
+                files,
+                capabilities,
+                self.tracker.dirs.user_cache_path / "encoded",
+                workers=self.tracker.config.get(self.tracker, "snapshot_workers"),
+            )
+        if capabilities.max_size and (
+            too_large := [x for x in encoded if x.size > capabilities.max_size]
+        ):
+            eprint(
+                f"{len(too_large)} of {len(encoded)} snapshots are larger than"
+                f" {humanize.naturalsize(capabilities.max_size, binary=True)},"
+                f" the limit of [cyan]{self.uploader}[/], not uploading them"
+            )
+            return None
+
+        stats.add(encoded)
+        return [x.path for x in encoded]
+
+    def upload(
+        self,
+        files: list[Path],
+        thumbnail_width: int | None = None,
+        name: str | None = None,
+    ) -> list[Any | dict[Any, Any] | None] | None:
+        if self.uploader in IMAGE_HOSTS:
+            if (encoded := self.encode(files)) is None:
+                return None
+            files = encoded
+
+        if self.uploader == "keksh":
+            return self.keksh(files)
+        elif self.uploader == "ptpimg":
+            return self.ptpimg(files)
+        elif self.uploader == "hdbimg":
+            return self.hdbimg(files, thumbnail_width, name)
+        else:
+            if not self.uploader:
+                wprint("Img uploader missing for from config!")
+            else:
+                wprint("Set Img uploader doesn't exist!")
+
+            return []
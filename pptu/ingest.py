@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from .hashing import Layout, PieceStore, StreamHasher
+from .readers import READ_SIZE
+from .torrent_v2 import FileHashStore, PieceHash, file_hashes, v2_layout
+
+
+if TYPE_CHECKING:
+    from torf import Torrent
+
+
+def copy_order(src: Path) -> list[Path]:
+    """Files to copy, in the order torf lays them out in v1 torrents."""
+    if src.is_file():
+        return [src]
+    # torf sorts by path components like Path does
+    return sorted(x for x in src.rglob("*") if x.is_file())
+
+
+class Ingest:
+    """
+    Copy a release while hashing it for the torrents that will be created from the copy.
+
+    Every file is read once. Each chunk is written to the destination and fed
+    to one stream hasher per distinct torrent layout, the hashes are then
+    stored under the identity of the copied files, so creating the torrents
+    for the destination doesn't have to read anything.
+    """
+
+    def __init__(
+        self,
+        src: Path,
+        dest: Path,
+        torrents: list[tuple[Torrent, bool]],
+        *,
+        read_size: int = READ_SIZE,
+    ):
+        self.src = Path(os.path.abspath(src))
+        self.dest = Path(os.path.abspath(dest))
+        self.read_size = read_size
+        self.files = copy_order(self.src)
+        self.size = sum(x.stat().st_size for x in self.files)
+
+        # Torrents of the source with the same files and piece size are hashed once
+        self.hashers: list[tuple[StreamHasher, bool]] = []
+        seen = set()
+        for torrent, v2 in torrents:
+            key = (tuple(str(x) for x in torrent.filepaths), torrent.piece_size, v2)
+            if key in seen:
+                continue
+            seen.add(key)
+            if v2:
+                hasher = StreamHasher(
+                    v2_layout(torrent)[1], partial(PieceHash, torrent.piece_size)
+                )
+            else:
+                hasher = StreamHasher(Layout.from_torrent(torrent))
+            self.hashers.append((hasher, v2))
+
+    def destination(self, path: Path) -> Path:
+        return self.dest / Path(os.path.abspath(path)).relative_to(self.src)
+
+    def run(self, callback: Callable[[Path, int], None] | None = None) -> None:
+        entries = [
+            {Path(os.path.abspath(x.path)): x for x in hasher.layout.files}
+            for hasher, _ in self.hashers
+        ]
+        with ThreadPoolExecutor(max_workers=max(1, len(self.hashers))) as pool:
+            for path in self.files:
+                target = self.destination(path)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                feeds = [
+                    (hasher, files[path])
+                    for (hasher, _), files in zip(self.hashers, entries, strict=True)
+                    if path in files
+                ]
+                with path.open("rb", buffering=0) as fsrc, target.open("wb") as fdst:
+                    offset = 0
+                    while data := fsrc.read(self.read_size):
+                        # Hashing releases the GIL, so the layouts are hashed while writing
+                        futures = [
+                            pool.submit(hasher.update, file, offset, data)
+                            for hasher, file in feeds
+                        ]
+                        fdst.write(data)
+                        for future in futures:
+                            future.result()
+                        offset += len(data)
+                        if callback:
+                            callback(path, len(data))
+                shutil.copystat(path, target)
+
+    def store(self, path: Path) -> int:
+        """
+        Store the piece hashes of the copied files in the piece cache at `path`.
+
+        Layouts whose files changed while copying are skipped. Returns the
+        number of stored layouts.
+        """
+        pieces = PieceStore(path)
+        files = FileHashStore(path)
+        stored = 0
+        try:
+            for hasher, v2 in self.hashers:
+                layout = hasher.layout
+                dest = Layout(
+                    [self.destination(x.path) for x in layout.files],
+                    layout.piece_size,
+                    aligned=v2,
+                )
+                if [x.size for x in dest.files] != [x.size for x in layout.files]:
+                    continue
+                hashes = hasher.finish()
+                if v2:
+                    files.put(
+                        [
+                            (
+                                FileHashStore.key(dest_file.identity, layout.piece_size),
+                                file_hashes(layout, src_file, hashes),
+                            )
+                            for src_file, dest_file in zip(layout.files, dest.files, strict=True)
+                            if src_file.size
+                        ]
+                    )
+                else:
+                    pieces.put(
+                        (PieceStore.key(dest, piece), digest)
+                        for piece, digest in hashes.items()
+                    )
+                stored += 1
+        finally:
+            pieces.close()
+            files.close()
+        return stored
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping, NamedTuple
+
+import torf
+from torf import Torrent
+
+
+if TYPE_CHECKING:
+    from .hashing import Layout
+
+
+class IndexedFile(NamedTuple):
+    name: str
+    size: int
+    offset: int  # Offset of the file in the indexed torrent's byte stream
+
+
+class Candidate(NamedTuple):
+    torrent_path: Path
+    pieces: dict[int, bytes]  # Our piece index -> piece hash from the indexed torrent
+
+
+class TorrentIndex:
+    """
+    On-disk index of the files described by existing .torrent files.
+
+    Files are looked up by name, size and piece size. Piece hashes are not
+    stored in the index, they are read from the indexed .torrent when it
+    matches.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS torrents (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                mtime INTEGER NOT NULL,
+                piece_size INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                torrent_id INTEGER NOT NULL REFERENCES torrents(id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                piece_size INTEGER NOT NULL,
+                offset INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS files_lookup ON files (name, size, piece_size);
+            """
+        )
+        self._db.execute("PRAGMA foreign_keys = ON")
+
+    def close(self) -> None:
+        self._db.close()
+
+    def scan(
+        self,
+        dirs: Iterable[Path],
+        callback: Callable[[Path], None] | None = None,
+    ) -> tuple[int, int]:
+        """
+        Index every .torrent file below `dirs`.
+
+        Unchanged torrents are skipped, vanished ones are removed.
+        Returns the number of added/updated and removed torrents.
+        """
+        known = dict(self._db.execute("SELECT path, mtime FROM torrents"))
+        seen = set()
+        updated = 0
+
+        with self._db:
+            for directory in dirs:
+                for torrent_path in directory.expanduser().rglob("*.torrent"):
+                    seen.add(str(torrent_path))
+                    try:
+                        mtime = torrent_path.stat().st_mtime_ns
+                    except OSError:
+                        continue
+                    if known.get(str(torrent_path)) == mtime:
+                        continue
+                    if callback:
+                        callback(torrent_path)
+                    if self._add(torrent_path, mtime):
+                        updated += 1
+
+            removed = [(x,) for x in known if x not in seen]
+            self._db.executemany("DELETE FROM torrents WHERE path = ?", removed)
+
+        return updated, len(removed)
+
+    def _add(self, torrent_path: Path, mtime: int) -> bool:
+        self._db.execute("DELETE FROM torrents WHERE path = ?", (str(torrent_path),))
+        try:
+            info = Torrent.read(torrent_path, validate=False).metainfo["info"]
+            files = _files(info)
+            piece_size = info["piece length"]
+            if not info.get("pieces"):
+                return False  # v2-only torrent
+        except (torf.TorfError, KeyError, TypeError, OSError):
+            return False
+
+        torrent_id = self._db.execute(
+            "INSERT INTO torrents (path, mtime, piece_size, size) VALUES (?, ?, ?, ?)",
+            (str(torrent_path), mtime, piece_size, sum(x.size for x in files)),
+        ).lastrowid
+        self._db.executemany(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+            [(torrent_id, x.name, x.size, piece_size, x.offset) for x in files],
+        )
+        return True
+
+    def lookup(self, layout: Layout) -> list[Candidate]:
+        """Find indexed torrents sharing pieces with `layout`."""
+        torrent_ids: set[int] = set()
+        for file in layout.files:
+            if file.size:
+                torrent_ids.update(
+                    x
+                    for (x,) in self._db.execute(
+                        "SELECT torrent_id FROM files"
+                        " WHERE name = ? AND size = ? AND piece_size = ?",
+                        (file.path.name, file.size, layout.piece_size),
+                    )
+                )
+
+        candidates = []
+        for torrent_id in sorted(torrent_ids):
+            path, size = self._db.execute(
+                "SELECT path, size FROM torrents WHERE id = ?", (torrent_id,)
+            ).fetchone()
+            files = [
+                IndexedFile(*x)
+                for x in self._db.execute(
+                    "SELECT name, size, offset FROM files WHERE torrent_id = ?",
+                    (torrent_id,),
+                )
+            ]
+            if not (pieces := _matching_pieces(layout, files, size)):
+                continue
+            try:
+                info = Torrent.read(path, validate=False).metainfo["info"]
+            except (torf.TorfError, OSError):
+                continue
+            hashes = info["pieces"]
+            candidates.append(
+                Candidate(
+                    Path(path),
+                    {
+                        ours: hashes[theirs * 20 : theirs * 20 + 20]
+                        for ours, theirs in pieces.items()
+                    },
+                )
+            )
+
+        return candidates
+
+
+def _files(info: Mapping[str, Any]) -> list[IndexedFile]:
+    if "length" in info:
+        return [IndexedFile(info["name"], info["length"], 0)]
+
+    files = []
+    offset = 0
+    for file in info["files"]:
+        files.append(IndexedFile(file["path"][-1], file["length"], offset))
+        offset += file["length"]
+    return files
+
+
+def _matching_pieces(
+    layout: Layout, files: list[IndexedFile], size: int
+) -> dict[int, int]:
+    """
+    Map our pieces to pieces of an indexed torrent covering the same bytes.
+
+    A piece matches when every file it overlaps exists in the indexed torrent
+    with the same name and size, and the bytes line up with the start and end
+    of one of its pieces.
+    """
+    offsets = {(x.name, x.size): x.offset for x in files if x.size}
+    piece_size = layout.piece_size
+
+    matches = {}
+    for piece in range(layout.pieces):
+        segments = layout.segments(piece)
+        start = None
+        expected = None
+        for file, offset, length in segments:
+            if (their_offset := offsets.get((file.path.name, file.size))) is None:
+                break
+            position = their_offset + offset
+            if expected is None:
+                start = expected = position
+            elif position != expected:
+                break
+            expected += length
+        else:
+            if (
+                start is not None
+                and start % piece_size == 0
+                and expected == min(start + piece_size, size)
+            ):
+                matches[piece] = start // piece_size
+    return matches
+
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import math
+from pathlib import Path
+from typing import Any
+
+import oxipng
+from wand.color import Color
+from wand.drawing import Drawing
+from wand.image import Image
+
+from .snapshots import Snapshot
+from .utils import write_atomic
+
+
+DEFAULT_MOSAIC_WIDTH = 3840  # Width of a contact sheet, unless the frames are smaller
+TILE_GAP = 4  # Pixels between tiles
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+
+def tile_snapshots(
+    snapshots: list[Snapshot],
+    path: Path,
+    *,
+    columns: int,
+    width: int = DEFAULT_MOSAIC_WIDTH,
+    png: dict[str, Any] | None = None,
+) -> Path:
+    """
+    Tile snapshots into one contact sheet, row by row, and write it as an optimized PNG.
+
+    Tiles have the aspect ratio of the first snapshot, frames of other
+    sources are fitted into them. The timestamp of every frame is drawn in
+    its bottom left corner.
+    """
+    columns = max(1, min(columns, len(snapshots)))
+    rows = math.ceil(len(snapshots) / columns)
+    with Image(filename=snapshots[0].path) as first:
+        # Frames aren't upscaled when the sheet is wider than all of them side by side
+        tile_width = min(first.width, (width - TILE_GAP * (columns - 1)) // columns)
+        tile_height = round(first.height * tile_width / first.width)
+
+    with Image(
+        width=columns * tile_width + TILE_GAP * (columns - 1),
+        height=rows * tile_height + TILE_GAP * (rows - 1),
+        background=Color("black"),
+    ) as sheet:
+        for i, snapshot in enumerate(snapshots):
+            left = i % columns * (tile_width + TILE_GAP)
+            top = i // columns * (tile_height + TILE_GAP)
+            with Image(filename=snapshot.path) as frame:
+                scale = min(tile_width / frame.width, tile_height / frame.height)
+                frame.resize(round(frame.width * scale), round(frame.height * scale))
+                sheet.composite(
+                    frame,
+                    left=left + (tile_width - frame.width) // 2,
+                    top=top + (tile_height - frame.height) // 2,
+                )
+
+            with Drawing() as draw:
+                draw.font_size = max(12, tile_height // 16)
+                draw.fill_color = Color("white")
+                draw.text_under_color = Color("#00000099")
+                margin = int(draw.font_size // 2)
+                draw.text(
+                    left + margin,
+                    top + tile_height - margin,
+                    format_timestamp(snapshot.timestamp),
+                )
+                draw(sheet)
+
+        sheet.depth = 8
+        data = sheet.make_blob("png")
+
+    write_atomic(path, oxipng.optimize_from_memory(data, **(png or {})))
+    return path
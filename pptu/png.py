@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from typing import Any, NamedTuple
+
+import oxipng
+
+
+class PngProfile(NamedTuple):
+    level: int  # oxipng preset
+    filters: tuple[str, ...] = ()  # Row filters to try, the preset's when empty
+    fast_evaluation: bool = True  # Pick filters heuristically instead of compressing with each
+    zopfli: int = 0  # Zopfli iterations, libdeflate when 0
+
+
+PNG_PROFILES = {
+    "fast": PngProfile(1, ("MinSum",)),
+    # oxipng's defaults, what snapshots always used
+    "balanced": PngProfile(2),
+    "max": PngProfile(
+        6,
+        ("NoOp", "Sub", "Up", "Average", "Paeth", "MinSum", "Entropy", "Bigrams", "BigEnt"),
+        fast_evaluation=False,
+    ),
+}
+DEFAULT_PNG_PROFILE = "balanced"
+
+
+def png_options(profile: str | None = None, zopfli: int | None = None) -> dict[str, Any]:
+    """
+    Return oxipng keyword arguments for a profile.
+
+    `zopfli` overrides the Zopfli iterations of the profile, it's much slower
+    than libdeflate for a few percent smaller files.
+    """
+    settings = PNG_PROFILES[profile or DEFAULT_PNG_PROFILE]
+    if zopfli is not None:
+        settings = settings._replace(zopfli=zopfli)
+
+    options: dict[str, Any] = {
+        "level": settings.level,
+        "fast_evaluation": settings.fast_evaluation,
+    }
+    if settings.filters:
+        options["filter"] = [getattr(oxipng.RowFilter, x) for x in settings.filters]
+    if settings.zopfli:
+        options["deflate"] = oxipng.Deflaters.zopfli(settings.zopfli)
+    return options
+
+
+def png_key(profile: str | None = None, zopfli: int | None = None) -> str:
+    """Return a name for the output of a profile, e.g. to tell cached files apart."""
+    profile = profile or DEFAULT_PNG_PROFILE
+    if zopfli is None:
+        zopfli = PNG_PROFILES[profile].zopfli
+    return f"{profile}-zopfli{zopfli}" if zopfli else profile
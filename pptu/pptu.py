@@ -1,29 +1,56 @@
 from __future__ import annotations
 
 import glob
+import hashlib
+import json
 import random
 import re
 import shutil
+import sqlite3
 import subprocess
 from pathlib import Path
-from typing import TYPE_CHECKING, Optional, Union
+from typing import TYPE_CHECKING, Any, Callable, Optional, TypeVar, Union
 
-import oxipng
 import torf
 from platformdirs import PlatformDirs
 from pymediainfo import MediaInfo
 from pyrosimple.util.metafile import Metafile
-from rich.progress import BarColumn, MofNCompleteColumn, Progress, TaskProgressColumn, TextColumn, TimeRemainingColumn
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    TaskProgressColumn,
+    TextColumn,
+    TimeElapsedColumn,
+    TimeRemainingColumn,
+)
 from torf import Torrent
-from wand.image import Image
-
-from .utils import Config, CustomTransferSpeedColumn, as_list, eprint, flatten, wprint
+from wand.exceptions import WandException
+
+from . import scoring
+from .checksums import CHECKSUM_FORMATS, DigestStore, FileDigests, write_sidecars
+from .clients import CLIENTS, Client, ClientError, ClientTorrent, RTorrent
+from .follow import Follower
+from .hashing import Layout, PieceHasher, PieceStore, TorrentHasher, fast_resume, verify_pieces
+from .library import TorrentIndex
+from .mosaic import DEFAULT_MOSAIC_WIDTH, tile_snapshots
+from .png import png_key, png_options
+from .readers import PREFETCH_DEPTH, resolve_io_mode
+from .snapshots import KeyframeIndex, Snapshot, extract_snapshots
+from .thumbnails import Thumbnail, create_thumbnails
+from .torrent_v2 import TORRENT_VERSIONS, FileHashStore, V2File, V2Hasher, bencode, metainfo
+from .tuning import TuningStore
+from .utils import Config, CustomTransferSpeedColumn, as_list, eprint, flatten, known_png_profile, wprint
 
 
 if TYPE_CHECKING:
     from .uploaders import Uploader
 
 
+T = TypeVar("T")
+
+
 class PPTU:
     def __init__(
         self,
@@ -33,16 +60,18 @@ class PPTU:
         note: str | None = None,
         auto: bool = False,
         snapshots: bool = False,
+        hash_io: str | None = None,
     ):
         self.path = path
         self.tracker = tracker
         self.note = note
         self.auto = auto
 
-        dirs = PlatformDirs(appname="pptu", appauthor=False)
-        self.cache_dir = dirs.user_cache_path / f"{path.name}_files"
+        self.dirs = PlatformDirs(appname="pptu", appauthor=False)
+        self.cache_dir = self.dirs.user_cache_path / f"{path.name}_files"
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.config = Config(dirs.user_config_path / "config.toml")
+        self.config = Config(self.dirs.user_config_path / "config.toml")
+        self.hash_io = hash_io or self.config.get("default", "hash_io", "auto")
 
         self.torrent_path = (
             self.cache_dir / f"{self.path.name}[{self.tracker.abbrev}].torrent"
@@ -59,27 +88,159 @@ class PPTU:
         else:
             self.num_snapshots = tracker.min_snapshots or 0
 
+    def _hash_options(self) -> dict[str, Any]:
+        """Return the I/O settings for hashing the path, tuned ones taking precedence over the config."""
+        tuned = None
+        if self.config.get("default", "hash_autotune", True):
+            tuned = TuningStore(self.dirs.user_cache_path / "io_profiles.json").get(
+                self.path
+            )
+        if tuned:
+            return {
+                "workers": tuned.workers,
+                "io_mode": tuned.io_mode if self.hash_io == "auto" else self.hash_io,
+                "read_size": tuned.read_size,
+                "prefetch": tuned.prefetch,
+            }
+        return {
+            "workers": self.config.get("default", "hash_workers"),
+            "io_mode": resolve_io_mode(self.hash_io, self.path),
+            "read_size": self.config.get("default", "hash_read_size", 4) * 1024**2,
+            "prefetch": self.config.get("default", "hash_prefetch", PREFETCH_DEPTH),
+        }
+
+    def follow(self) -> None:
+        """Hash the file while it's still being written, so creating the torrent is instant."""
+        if not self.path.is_file():
+            wprint("Only single files can be followed, hashing once complete")
+            return
+        if not self.config.get("default", "piece_cache", True):
+            wprint("Following needs piece_cache to be enabled")
+            return
+
+        follower = Follower(
+            self.path,
+            self.cache_dir,
+            read_size=self._hash_options()["read_size"],
+            idle=self.config.get("default", "follow_idle", 30),
+        )
+        with Progress(
+            TextColumn("{task.description}"),
+            CustomTransferSpeedColumn(),
+            TimeElapsedColumn(),
+        ) as progress:
+            task = progress.add_task(description=f"Hashing {self.path.name} while it's written")
+            follower.run(lambda _, length: progress.update(task, advance=length))
+
+        store = PieceStore(self.dirs.user_cache_path / "pieces.db")
+        try:
+            if not follower.store(store, self._hash_options()["workers"]):
+                wprint("File wasn't written sequentially, it has to be hashed again")
+        finally:
+            store.close()
+
     def create_torrent(self) -> bool:
+        return PPTU.create_torrents([self])[0]
+
+    @staticmethod
+    def create_torrents(pptus: list[PPTU]) -> list[bool]:
+        """Create the torrent files of several trackers, hashing every distinct file set once."""
+        results: dict[PPTU, bool] = {}
+        groups: dict[tuple[tuple[str, ...], int, str], list[tuple[PPTU, Torrent]]] = {}
+
+        for pptu in pptus:
+            if pptu.torrent_path.exists():
+                results[pptu] = True
+                continue
+            version = pptu.config.get(pptu.tracker, "torrent_version", "v1")
+            if version not in TORRENT_VERSIONS:
+                eprint(
+                    f"Invalid torrent version [cyan]{version}[/] for tracker"
+                    f" [cyan]{pptu.tracker.name}[/], expected one of {', '.join(TORRENT_VERSIONS)}."
+                )
+                results[pptu] = False
+                continue
+            if not (torrent := pptu._new_torrent()):
+                results[pptu] = False
+                continue
+            key = (tuple(str(x) for x in torrent.filepaths), torrent.piece_size, version)
+            groups.setdefault(key, []).append((pptu, torrent))
+
+        for (_, _, version), group in groups.items():
+            pptu, torrent = group[0]
+            formats = sorted({x for y, _ in group for x in y._checksum_formats()})
+            if version != "v1":
+                files = pptu._hash_files(
+                    torrent, [x.tracker.abbrev for x, _ in group], formats
+                )
+                for pptu, torrent in group:
+                    results[pptu] = files is not None
+                    if files is not None:
+                        pptu.torrent_path.write_bytes(
+                            bencode(
+                                metainfo(
+                                    files,
+                                    name=torrent.name or pptu.path.name,
+                                    piece_size=torrent.piece_size,
+                                    hybrid=version == "hybrid",
+                                    trackers=flatten(torrent.trackers),
+                                    private=bool(torrent.private),
+                                    source=torrent.source,
+                                    entropy=torrent.metainfo["info"].get("entropy"),
+                                )
+                            )
+                        )
+                continue
+
+            pieces = None
+            if not formats:
+                pieces = pptu._find_cached_pieces(torrent)
+            if pieces is None:
+                pieces = pptu._hash_pieces(
+                    torrent, [x.tracker.abbrev for x, _ in group], formats
+                )
+
+            if pieces is None:
+                results.update((x, False) for x, _ in group)
+                continue
+
+            # One stat of every file for the resume data of all trackers
+            layout = Layout.from_torrent(torrent)
+            for pptu, torrent in group:
+                results[pptu] = True
+                torrent.metainfo["info"]["pieces"] = pieces
+                torrent.write(pptu.torrent_path)
+                if pptu.config.get(pptu.tracker, "watch_dir") or pptu.config.get(
+                    pptu.tracker, "client"
+                ):
+                    pptu._write_resume(torrent, layout)
+
+        return [results[x] for x in pptus]
+
+    @property
+    def resume_path(self) -> Path:
+        return self.torrent_path.with_name(
+            self.torrent_path.name.replace(".torrent", "-resume.torrent")
+        )
+
+    def _write_resume(self, torrent: Torrent, layout: Layout) -> None:
+        """Write the torrent with fast resume data for the watch dir, from the hashed state."""
+        metainfo: Any = torrent.metainfo
+        metainfo["libtorrent_resume"] = fast_resume(layout)
+        try:
+            torrent.write(self.resume_path, overwrite=True)
+        finally:
+            del metainfo["libtorrent_resume"]
+
+    def _new_torrent(self) -> Torrent | None:
         announce_url: list = as_list(self.tracker.announce_url)
 
         passkey = self.config.get(self.tracker, "passkey") or self.tracker.passkey
         if not passkey and any("{passkey}" in x for x in announce_url):
             eprint(f"Passkey not found for tracker [cyan]{self.tracker.name}[cyan].")
-            return False
-
-        base_torrent_path = next(
-            iter(
-                self.cache_dir.glob(
-                    glob.escape(f"{self.path.name}[") + "*" + glob.escape("].torrent")
-                )
-            ),
-            None,
-        )
-
-        if self.torrent_path.exists():
-            return True
+            return None
 
-        torrent = Torrent(
+        return Torrent(
             self.path,
             trackers=[x.format(passkey=passkey) for x in announce_url],
             private=True,
@@ -90,46 +251,215 @@ class PPTU:
             exclude_regexs=[self.tracker.exclude_regexs],
         )
 
-        if base_torrent_path:
-            torrent.reuse(base_torrent_path)
+    def _checksum_formats(self) -> list[str]:
+        """Return the checksum sidecar formats wanted by the tracker and not written yet."""
+        formats = []
+        for fmt in as_list(self.config.get(self.tracker, "checksums", [])):
+            if fmt not in CHECKSUM_FORMATS:
+                wprint(
+                    f"Unknown checksum format [cyan]{fmt}[/], expected one of"
+                    f" {', '.join(CHECKSUM_FORMATS)}"
+                )
+            elif not (self.cache_dir / f"{self.path.name}.{fmt}").exists():
+                formats.append(fmt)
+        return formats
+
+    def _file_digests(self, formats: list[str], cache: bool = True) -> FileDigests | None:
+        if not formats:
+            return None
+        store = None
+        if cache and self.config.get("default", "piece_cache", True):
+            store = DigestStore(self.dirs.user_cache_path / "pieces.db")
+        return FileDigests((CHECKSUM_FORMATS[x] for x in formats), store)
+
+    def _write_checksums(
+        self, torrent: Torrent, digests: FileDigests, formats: list[str]
+    ) -> None:
+        written = write_sidecars(
+            self.cache_dir,
+            self.path.name,
+            Path(torrent.path or self.path),
+            formats,
+            digests.result(),
+        )
+        print(f"Wrote {', '.join(x.name for x in written)}")
+
+    def _find_cached_pieces(self, torrent: Torrent) -> bytes | None:
+        """Return the pieces of a cached torrent with the same files and piece size."""
+        info = torrent.metainfo["info"]
+        hasher = PieceHasher(Layout.from_torrent(torrent), **self._hash_options())
+        for base_torrent_path in self.cache_dir.glob(
+            glob.escape(f"{self.path.name}[") + "*" + glob.escape("].torrent")
+        ):
             try:
-                torrent.validate()
-            except torf.MetainfoError:
-                wprint("Torrent file is invalid, recreating")
-            else:
-                torrent.trackers = [self.tracker.announce_url.format(passkey=passkey)]
-                torrent.randomize_infohash = True
-                torrent.source = self.tracker.source
-                torrent.private = True
-                torrent.write(self.torrent_path)
-        else:
-            print()
-            with Progress(
-                BarColumn(),
-                CustomTransferSpeedColumn(),
-                TaskProgressColumn(),
-                TimeRemainingColumn(elapsed_when_finished=True),
-            ) as progress:
-                files = []
-
-                def update_progress(
-                    torrent: Torrent, filepath: str, pieces_done: int, pieces_total: int
-                ) -> None:
-                    if filepath not in files:
-                        print(f"Hashing {Path(filepath).name}...")
-                        files.append(filepath)
-
-                    progress.update(
-                        task,
-                        completed=pieces_done * torrent.piece_size,
-                        total=pieces_total * torrent.piece_size,
-                    )
-
-                task = progress.add_task(description="")
-                torrent.generate(callback=update_progress)
-                torrent.write(self.torrent_path)
+                base_info = Torrent.read(base_torrent_path).metainfo["info"]
+            except torf.TorfError:
+                wprint(f"Torrent file {base_torrent_path.name!r} is invalid, ignoring")
+                continue
+            if not all(
+                base_info.get(key) == info.get(key)
+                for key in ("name", "piece length", "length", "files")
+            ):
+                continue
+            try:
+                valid = verify_pieces(
+                    hasher,
+                    base_info["pieces"],
+                    samples=self.config.get("default", "cache_verify_pieces", 3),
+                    changed_since=base_torrent_path.stat().st_mtime_ns,
+                )
+            except OSError as e:
+                eprint(f"Verifying {base_torrent_path.name!r} failed: [cyan]{e}[/]")
+                return None
+            if valid:
+                return base_info["pieces"]
+            wprint(f"Files changed since {base_torrent_path.name!r} was created, ignoring")
+        return None
+
+    def _hash_with_caches(
+        self,
+        torrent: Torrent,
+        formats: list[str],
+        store_type: Callable[[Path], PieceStore | FileHashStore],
+        hash: Callable[[Any, FileDigests | None, dict[str, Any]], T],
+    ) -> T | None:
+        """Run `hash` with the piece store, file digests and I/O settings, then write checksums."""
+        options = self._hash_options()
+        if options["io_mode"] == "network" and self.hash_io == "auto":
+            print("Network filesystem detected, prefetching reads")
+
+        try:
+            return self._hash_once(torrent, formats, store_type, hash, options)
+        except sqlite3.Error as e:
+            # The cache is shared with other runs, it's not worth failing over
+            wprint(f"Piece cache unavailable, hashing without it: [cyan]{e}[/]")
+            return self._hash_once(torrent, formats, None, hash, options)
+
+    def _hash_once(
+        self,
+        torrent: Torrent,
+        formats: list[str],
+        store_type: Callable[[Path], PieceStore | FileHashStore] | None,
+        hash: Callable[[Any, FileDigests | None, dict[str, Any]], T],
+        options: dict[str, Any],
+    ) -> T | None:
+        store = None
+        digests = None
+        try:
+            if store_type and self.config.get("default", "piece_cache", True):
+                store = store_type(self.dirs.user_cache_path / "pieces.db")
+            digests = self._file_digests(formats, cache=store_type is not None)
+            result = hash(store, digests, options)
+            if digests:
+                self._write_checksums(torrent, digests, formats)
+            return result
+        except OSError as e:
+            eprint(f"Hashing failed: [cyan]{e}[/]")
+            return None
+        finally:
+            if store:
+                store.close()
+            if digests and digests.store:
+                digests.store.close()
+
+    def _hash_pieces(
+        self, torrent: Torrent, abbrevs: list[str], formats: list[str]
+    ) -> bytes | None:
+        def hash(
+            store: PieceStore | None, digests: FileDigests | None, options: dict[str, Any]
+        ) -> bytes:
+            hasher = TorrentHasher(
+                torrent,
+                store=store,
+                checkpoint_dir=self.cache_dir,
+                digests=digests,
+                **options,
+            )
+            if not hasher.verify(self.config.get("default", "cache_verify_pieces", 3)):
+                wprint("Files changed since their pieces were cached, hashing them again")
+            if hasher.resumed:
+                print(
+                    "Resumed at "
+                    f"{(hasher.layout.size - hasher.pending) / hasher.layout.size:.0%}"
+                )
+            elif hasher.cached:
+                print(
+                    f"Reusing {hasher.cached}/{hasher.layout.pieces} pieces from cache"
+                )
 
-        return True
+            index_path = self.dirs.user_cache_path / "index.db"
+            if hasher.missing and index_path.exists():
+                try:
+                    index = TorrentIndex(index_path)
+                    try:
+                        reused = hasher.reuse(
+                            (x.pieces for x in index.lookup(hasher.layout)),
+                            samples=self.config.get("default", "index_verify_pieces", 3),
+                        )
+                    finally:
+                        index.close()
+                except sqlite3.Error as e:
+                    wprint(f"Torrent index unavailable, not reusing pieces: [cyan]{e}[/]")
+                    reused = 0
+                if reused:
+                    print(f"Reusing {reused} pieces from indexed torrents")
+
+            if not hasher.pending:
+                hasher.run()
+            else:
+                self._run_hasher(hasher, abbrevs)
+            pieces: bytes = torrent.metainfo["info"]["pieces"]
+            return pieces
+
+        return self._hash_with_caches(torrent, formats, PieceStore, hash)
+
+    def _hash_files(
+        self, torrent: Torrent, abbrevs: list[str], formats: list[str]
+    ) -> list[V2File] | None:
+        """Hash the files of a v2 or hybrid torrent, reusing cached Merkle roots."""
+
+        def hash(
+            store: FileHashStore | None,
+            digests: FileDigests | None,
+            options: dict[str, Any],
+        ) -> list[V2File]:
+            hasher = V2Hasher(torrent, store=store, digests=digests, **options)
+            if hasher.hashes:
+                print(
+                    f"Reusing {len(hasher.hashes)}/{len(hasher.hashes) + len(hasher.missing)}"
+                    " files from cache"
+                )
+            if not hasher.pending:
+                return hasher.run()
+            files: list[V2File] = self._run_hasher(hasher, abbrevs)
+            return files
+
+        return self._hash_with_caches(torrent, formats, FileHashStore, hash)
+
+    @staticmethod
+    def _run_hasher(hasher: TorrentHasher | V2Hasher, abbrevs: list[str]) -> Any:
+        print(f"Hashing pieces for {', '.join(abbrevs)}")
+        with Progress(
+            BarColumn(),
+            CustomTransferSpeedColumn(),
+            TaskProgressColumn(),
+            TimeRemainingColumn(elapsed_when_finished=True),
+        ) as progress:
+            files = []
+
+            def update_progress(filepath: Path, length: int) -> None:
+                if filepath not in files:
+                    print(f"Hashing {filepath.name}...")
+                    files.append(filepath)
+
+                progress.update(task, advance=length)
+
+            # Aligned v2 layouts have gaps between files, only count file data
+            size = sum(x.size for x in hasher.layout.files)
+            task = progress.add_task(
+                description="", total=size, completed=size - hasher.pending
+            )
+            return hasher.run(update_progress)
 
     def get_mediainfo(self) -> str | list[str]:
         mediainfo_path = self.cache_dir / "mediainfo.txt"
@@ -156,14 +486,107 @@ class PPTU:
         return mediainfo_list
 
     def generate_snapshots(self) -> list[Path]:
+        return PPTU.create_snapshots([self])[0]
+
+    @staticmethod
+    def create_snapshots(pptus: list[PPTU]) -> list[list[Path]]:
+        """Extract one snapshot set per group of trackers with the same settings."""
+        print()
+        groups: dict[tuple[tuple[bool, bool], tuple[str, int, bool]], list[PPTU]] = {}
+        for pptu in pptus:
+            key = (pptu._snapshot_mode(), pptu._snapshot_settings())
+            groups.setdefault(key, []).append(pptu)
+
+        results: dict[int, list[Path]] = {}
+        for group in groups.values():
+            leader = max(group, key=lambda x: x._snapshot_count())
+            snapshots = leader._extract_snapshots(
+                [x.tracker.abbrev for x in group if x._snapshot_count()]
+            )
+            for pptu in group:
+                subset = pptu._snapshot_subset(snapshots)
+                if subset and pptu._wants_mosaic():
+                    results[id(pptu)] = pptu._tile_snapshots(subset)
+                else:
+                    results[id(pptu)] = [x.path for x in subset]
+        return [results[id(x)] for x in pptus]
+
+    @staticmethod
+    def create_thumbnails(pptus: list[PPTU], snapshots: list[list[Path]]) -> None:
+        """Generate the thumbnails every tracker's description needs at once."""
+        jobs: dict[tuple[str, int | None], dict[Path, list[Thumbnail]]] = {}
+        for pptu, tracker_snapshots in zip(pptus, snapshots, strict=True):
+            # PNG thumbnails are optimized with the profile of their tracker
+            group = jobs.setdefault(pptu._png_settings(), {})
+            for thumbnail, paths in pptu.tracker.thumbnails(tracker_snapshots).items():
+                for path in paths:
+                    group.setdefault(path, []).append(thumbnail)
+        if not any(jobs.values()):
+            return
+
+        leader = pptus[0]
+        with Progress(
+            TextColumn("[progress.description]{task.description}[/]"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TaskProgressColumn(),
+            TimeRemainingColumn(elapsed_when_finished=True),
+        ) as progress:
+            task = progress.add_task(
+                description="[bold green]Generating thumbnails[/]",
+                total=sum(len(x) for x in jobs.values()),
+            )
+            for (png_profile, png_zopfli), group in jobs.items():
+                create_thumbnails(
+                    group,
+                    leader.dirs.user_cache_path / "thumbnails",
+                    workers=leader.config.get("default", "snapshot_workers"),
+                    png_profile=png_profile,
+                    png_zopfli=png_zopfli,
+                    callback=lambda _: progress.update(task, advance=1),
+                )
+
+    def _snapshot_files(self) -> list[Path]:
         if self.path.is_dir():
-            files = sorted([*self.path.glob("*.mkv"), *self.path.glob("*.mp4")])
-        elif self.path.is_file():
-            files = [self.path]
+            return sorted([*self.path.glob("*.mkv"), *self.path.glob("*.mp4")])
+        return [self.path]
+
+    def _snapshot_mode(self) -> tuple[bool, bool]:
+        """Return whether snapshots are taken of every file and placed randomly."""
+        return (
+            bool(self.tracker.all_files and self.path.is_dir()),
+            bool(self.tracker.random_snapshots),
+        )
 
-        num_snapshots = self.num_snapshots
-        if self.tracker.all_files and self.path.is_dir():
-            num_snapshots = len(files)
+    def _snapshot_settings(self) -> tuple[str, int, bool]:
+        """Return the PNG profile, candidates and keyframe snapping snapshots are extracted with."""
+        candidates = self.config.get(self.tracker, "snapshot_candidates", 1)
+        if candidates < 2 or not scoring.available():
+            candidates = 1
+        keyframes = bool(self.config.get(self.tracker, "snapshot_keyframes", True))
+        return png_key(*self._png_settings()), candidates, keyframes
+
+    def _snapshot_count(self) -> int:
+        if self._snapshot_mode()[0]:
+            return len(self._snapshot_files())
+        return int(self.num_snapshots)
+
+    def _snapshot_subset(self, snapshots: list[Snapshot]) -> list[Snapshot]:
+        """Pick the snapshots of this tracker from a shared set."""
+        count = min(self._snapshot_count(), len(snapshots))
+        if not count or self.tracker.random_snapshots:
+            return snapshots[:count]
+        # Nearest to where the snapshots would be when taking only `count` of them
+        return [
+            snapshots[round((k + 1) * (len(snapshots) + 1) / (count + 1)) - 1]
+            for k in range(count)
+        ]
+
+    def _extract_snapshots(self, abbrevs: list[str]) -> list[Snapshot]:
+        files = self._snapshot_files()
+        num_snapshots = self._snapshot_count()
+        all_files, random_snapshots = self._snapshot_mode()
+        png_name, candidates, keyframes = self._snapshot_settings()
 
         orig_files = files[:]
         i = 2
@@ -171,77 +594,218 @@ class PPTU:
             files = flatten(zip(*([orig_files] * i)))
             i += 1
 
+        if not num_snapshots:
+            return []
+
+        durations: dict[Path, float] = {}
+        for file in dict.fromkeys(files[:num_snapshots]):
+            mediainfo_obj = MediaInfo.parse(file)
+            if not mediainfo_obj.video_tracks:
+                eprint("File has no video tracks")
+                return []
+            if not mediainfo_obj.audio_tracks:
+                eprint("File has no audio tracks")
+                return []
+            durations[file] = float(mediainfo_obj.video_tracks[0].duration) / 1000
+
+        rand = random.Random(self.path.name)
         snapshots = []
-        print()
-        if num_snapshots:
-            last_file = None
-            with Progress(
-                TextColumn("[progress.description]{task.description}[/]"),
-                BarColumn(),
-                MofNCompleteColumn(),
-                TaskProgressColumn(),
-                TimeRemainingColumn(elapsed_when_finished=True),
-            ) as progress:
-                for i in progress.track(
-                    range(num_snapshots),
-                    description=f"[bold green]Generating snapshots ({self.tracker.abbrev})[/]",
-                ):
-                    mediainfo_obj = MediaInfo.parse(files[i])
-                    if not mediainfo_obj.video_tracks:
-                        eprint("File has no video tracks")
-                        return []
-                    if not mediainfo_obj.audio_tracks:
-                        eprint("File has no audio tracks")
-                        return []
-                    duration = float(mediainfo_obj.video_tracks[0].duration) / 1000
-                    interval = duration / (num_snapshots + 1)
-
-                    j = i
-                    if last_file != files[i]:
-                        j = 0
-                    last_file = files[i]
-
-                    snap = self.cache_dir / "{num:02}{suffix}.png".format(
+        last_file = None
+        for i in range(num_snapshots):
+            interval = durations[files[i]] / (num_snapshots + 1)
+
+            j = i
+            if last_file != files[i]:
+                j = 0
+            last_file = files[i]
+
+            snapshots.append(
+                Snapshot(
+                    # The total is part of the name, sets of different sizes are placed
+                    # differently, and so are the settings they're extracted with
+                    self.cache_dir / "{num:02}_{total:02}{suffix}.png".format(
                         num=i + 1,
+                        total=num_snapshots,
                         suffix=(
-                            ("_all" if self.tracker.all_files else "")
-                            + ("_rand" if self.tracker.random_snapshots else "")
+                            ("_all" if all_files else "")
+                            + ("_rand" if random_snapshots else "")
+                            + f"_{png_name}"
+                            + (f"_c{candidates}" if candidates > 1 else "")
+                            + ("_kf" if keyframes else "")
                         ),
+                    ),
+                    files[i],
+                    rand.randint(
+                        round(interval * 10),
+                        round(interval * 10 * num_snapshots),
+                    )
+                    / 10
+                    if random_snapshots
+                    else interval * (j + 1),
+                )
+            )
+
+        if (
+            self.config.get(self.tracker, "snapshot_candidates", 1) > 1
+            and not scoring.available()
+        ):
+            wprint("NumPy is not installed, snapshot candidates are not scored")
+        if candidates > 1:
+            snapshots = self._pick_candidates(snapshots, candidates, durations)
+        elif keyframes:
+            snapshots = self._snap_to_keyframes(snapshots)
+
+        cached = {x.path for x in snapshots if x.path.exists()}
+        with Progress(
+            TextColumn("[progress.description]{task.description}[/]"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TaskProgressColumn(),
+            TimeRemainingColumn(elapsed_when_finished=True),
+        ) as progress:
+            task = progress.add_task(
+                description=f"[bold green]Generating snapshots ({', '.join(abbrevs)})[/]",
+                total=num_snapshots,
+                completed=len(cached),
+            )
+            extract_snapshots(
+                snapshots,
+                workers=self.config.get(self.tracker, "snapshot_workers"),
+                cpu_limit=self.config.get(self.tracker, "snapshot_threads"),
+                batch=self.config.get(self.tracker, "snapshot_batch", True),
+                png=self._png_options(),
+                callback=lambda _: progress.update(task, advance=1),
+            )
+        return self._snapshot_timestamps(snapshots, cached)
+
+    def _snapshot_timestamps(
+        self, snapshots: list[Snapshot], cached: set[Path]
+    ) -> list[Snapshot]:
+        """Record the timestamps of extracted snapshots, and restore those of cached ones."""
+        path = self.cache_dir / "snapshots.json"
+        try:
+            timestamps = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            timestamps = {}
+
+        snapshots = [
+            x._replace(timestamp=timestamps.get(x.path.name, x.timestamp))
+            if x.path in cached
+            else x
+            for x in snapshots
+        ]
+        timestamps.update({x.path.name: x.timestamp for x in snapshots})
+        path.write_text(json.dumps(timestamps))
+        return snapshots
+
+    def _wants_mosaic(self) -> bool:
+        if not self.config.get(self.tracker, "snapshot_mosaic", False):
+            return False
+        if not self.tracker.mosaic_snapshots:
+            wprint(f"{self.tracker.abbrev} needs separate snapshots, not tiling them")
+            return False
+        return True
+
+    def _tile_snapshots(self, snapshots: list[Snapshot]) -> list[Path]:
+        """Tile snapshots into a contact sheet, the snapshots_plus extras kept as separate files."""
+        split = len(snapshots) - self.tracker.snapshots_plus
+        tiled, kept = snapshots[:split], snapshots[split:]
+        if not tiled:
+            return [x.path for x in snapshots]
+
+        columns = self.config.get(self.tracker, "snapshot_columns", 2)
+        width = self.config.get(self.tracker, "snapshot_mosaic_width", DEFAULT_MOSAIC_WIDTH)
+        frames = "|".join(f"{x.path.name}@{x.timestamp}" for x in tiled)
+        key = hashlib.sha1(
+            f"{columns}:{width}:{png_key(*self._png_settings())}:{frames}".encode()
+        ).hexdigest()
+        path = self.cache_dir / f"mosaic_{key[:16]}.png"
+        if not path.exists():
+            try:
+                with Console().status(
+                    f"Tiling {len(tiled)} snapshots ({self.tracker.abbrev})..."
+                ):
+                    tile_snapshots(
+                        tiled, path, columns=columns, width=width, png=self._png_options()
                     )
+            except (OSError, WandException) as e:
+                wprint(f"Tiling snapshots failed, using them separately: {e}")
+                return [x.path for x in snapshots]
+        return [path, *(x.path for x in kept)]
+
+    def _png_settings(self) -> tuple[str, int | None]:
+        return (
+            known_png_profile(self.config.get(self.tracker, "png_profile")),
+            self.config.get(self.tracker, "png_zopfli"),
+        )
 
-                    if not snap.exists():
-                        subprocess.run(
-                            [
-                                "ffmpeg",
-                                "-y",
-                                "-v",
-                                "error",
-                                "-ss",
-                                str(
-                                    random.randint(
-                                        round(interval * 10),
-                                        round(interval * 10 * num_snapshots),
-                                    )
-                                    / 10
-                                    if self.tracker.random_snapshots
-                                    else str(interval * (j + 1))
-                                ),
-                                "-i",
-                                files[i],
-                                "-vf",
-                                "scale='max(sar,1)*iw':'max(1/sar,1)*ih'",
-                                "-frames:v",
-                                "1",
-                                snap,
-                            ],
-                            check=True,
+    def _png_options(self) -> dict[str, Any]:
+        return png_options(*self._png_settings())
+
+    def _pick_candidates(
+        self, snapshots: list[Snapshot], count: int, durations: dict[Path, float]
+    ) -> list[Snapshot]:
+        """Replace snapshots that aren't cached yet by the best of `count` candidates around them."""
+        missing = [i for i, x in enumerate(snapshots) if not x.path.exists()]
+        if not missing:
+            return snapshots
+
+        slots = []
+        for i in missing:
+            snapshot = snapshots[i]
+            duration = durations[snapshot.source]
+            spread = duration / (len(snapshots) + 1) / 2
+            slots.append(
+                [
+                    snapshot._replace(
+                        timestamp=min(
+                            max(0, snapshot.timestamp + spread * (k / (count - 1) - 0.5)),
+                            duration,
                         )
-                        with Image(filename=snap) as img:
-                            img.depth = 8
-                            img.save(filename=snap)
-                        oxipng.optimize(snap)
-                    snapshots.append(snap)
+                    )
+                    for k in range(count)
+                ]
+            )
+        if self.config.get(self.tracker, "snapshot_keyframes", True):
+            flat = iter(self._snap_to_keyframes([x for slot in slots for x in slot]))
+            slots = [[next(flat) for _ in slot] for slot in slots]
+
+        try:
+            with Console().status(f"Scoring {len(slots) * count} snapshot candidates..."):
+                picked = scoring.pick_candidates(
+                    slots,
+                    workers=self.config.get(self.tracker, "snapshot_workers"),
+                    cpu_limit=self.config.get(self.tracker, "snapshot_threads"),
+                )
+        except (OSError, RuntimeError, ValueError, subprocess.CalledProcessError) as e:
+            wprint(f"Scoring snapshot candidates failed: {e}")
+            return snapshots
+
+        snapshots = snapshots[:]
+        for i, snapshot in zip(missing, picked, strict=True):
+            snapshots[i] = snapshot
+        return snapshots
 
+    def _snap_to_keyframes(self, snapshots: list[Snapshot]) -> list[Snapshot]:
+        """Move snapshots that aren't cached yet to the nearest keyframe."""
+        index = KeyframeIndex(self.cache_dir / "keyframes.json")
+        sources: dict[Path, list[int]] = {}
+        for i, snapshot in enumerate(snapshots):
+            if not snapshot.path.exists():
+                sources.setdefault(snapshot.source, []).append(i)
+
+        snapshots = snapshots[:]
+        for source, indexes in sources.items():
+            try:
+                keyframes = index.snap(source, [snapshots[i].timestamp for i in indexes])
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                wprint(f"Finding keyframes in {source.name!r} failed, seeking exactly: {e}")
+                continue
+            for i, keyframe in zip(indexes, keyframes, strict=True):
+                if keyframe is not None:
+                    snapshots[i] = snapshots[i]._replace(
+                        timestamp=max(0, keyframe), keyframe=True
+                    )
         return snapshots
 
     def prepare(self, mediainfo: str | list[str], snapshots: list[Path]) -> bool:
@@ -257,7 +821,10 @@ class PPTU:
             return False
         return True
 
-    def upload(self, mediainfo: str | list[str], snapshots: list[Path]) -> None:
+    def upload(
+        self, mediainfo: str | list[str], snapshots: list[Path], *, seed: bool = True
+    ) -> bool:
+        """Upload the torrent, and start seeding it unless `seed` is False."""
         if not self.tracker.upload(
             self.path,
             self.torrent_path,
@@ -267,18 +834,73 @@ class PPTU:
             auto=self.auto,
         ):
             eprint(f"Upload to [cyan]{self.tracker.name}[/] failed.")
-            return
+            return False
 
-        torrent_path = (
-            self.cache_dir / f"{self.path.name}[{self.tracker.abbrev}].torrent"
-        )
-        if watch_dir := self.config.get(self.tracker, "watch_dir"):
-            watch_dir = Path(watch_dir).expanduser()
-            metafile = Metafile.from_file(torrent_path)
+        if seed:
+            PPTU.seed([self])
+        return True
+
+    @staticmethod
+    def seed(pptus: list[PPTU]) -> None:
+        """Start seeding uploaded torrents in the configured client, or via the watch dir."""
+        groups: dict[tuple[type[Client], str, str, str], list[PPTU]] = {}
+        for pptu in pptus:
+            if not (name := pptu.config.get(pptu.tracker, "client")):
+                pptu._copy_to_watch_dir()
+                continue
+            if name.lower() not in CLIENTS:
+                eprint(
+                    f"Unknown torrent client [cyan]{name}[/], expected one of"
+                    f" {', '.join(CLIENTS)}."
+                )
+                pptu._copy_to_watch_dir()
+                continue
+            key = (
+                CLIENTS[name.lower()],
+                pptu.config.get(pptu.tracker, "client_url", ""),
+                pptu.config.get(pptu.tracker, "client_username", ""),
+                pptu.config.get(pptu.tracker, "client_password", ""),
+            )
+            groups.setdefault(key, []).append(pptu)
+
+        for (client_cls, url, username, password), group in groups.items():
+            client = client_cls(url, username, password)
+            try:
+                client.load([x._client_torrent(client) for x in group])
+            except (ClientError, OSError) as e:
+                eprint(f"Loading torrents into [cyan]{client.name}[/] failed: [cyan]{e}[/]")
+                for pptu in group:
+                    pptu._copy_to_watch_dir()
+                continue
+            print(f"Started seeding {len(group)} torrent(s) in {client.name}")
+
+    def _resume_torrent(self) -> Path | None:
+        """Return the torrent with fast resume data, None for v2 and hybrid torrents."""
+        if self.config.get(self.tracker, "torrent_version", "v1") != "v1":
+            return None
+        if (
+            not self.resume_path.exists()
+            # Torrents created by an earlier run, or replaced by the tracker's own on upload
+            or self.torrent_path.stat().st_mtime_ns > self.resume_path.stat().st_mtime_ns
+        ):
+            metafile = Metafile.from_file(self.torrent_path)
             metafile.add_fast_resume(self.path)
-            resume_path = Path(str(torrent_path).replace(".torrent", "-resume.torrent"))
-            metafile.save(resume_path)
-            shutil.copy(resume_path, watch_dir)
+            metafile.save(self.resume_path)
+        return self.resume_path
+
+    def _client_torrent(self, client: Client) -> ClientTorrent:
+        torrent_path = self.torrent_path
+        # Only rtorrent reads libtorrent_resume, the others skip checking by themselves
+        if isinstance(client, RTorrent):
+            torrent_path = self._resume_torrent() or torrent_path
+        return ClientTorrent(torrent_path.read_bytes(), self.path.resolve().parent)
+
+    def _copy_to_watch_dir(self) -> None:
+        if watch_dir := self.config.get(self.tracker, "watch_dir"):
+            if not (resume_path := self._resume_torrent()):
+                wprint("Fast resume is only supported for v1 torrents, not adding to watch dir")
+                return
+            shutil.copy(resume_path, Path(watch_dir).expanduser())
 
     def __str__(self) -> str:
         return f"{self.tracker.abbrev} ({self.torrent_path})"
@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import errno
+import mmap
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
+
+
+if TYPE_CHECKING:
+    from .hashing import FileEntry
+
+
+IO_MODES = ("auto", "buffered", "sequential", "direct", "network")
+READ_SIZE = 4 * 1024 * 1024  # Size of a single positional read
+PREFETCH_DEPTH = 8  # Reads kept in flight per job on network filesystems
+NETWORK_FILESYSTEMS = {
+    "9p",
+    "afs",
+    "ceph",
+    "cifs",
+    "davfs",
+    "fuse.gcsfuse",
+    "fuse.glusterfs",
+    "fuse.rclone",
+    "fuse.s3fs",
+    "fuse.sshfs",
+    "glusterfs",
+    "lustre",
+    "ncpfs",
+    "nfs",
+    "nfs4",
+    "smb3",
+    "smbfs",
+}
+ALIGNMENT = 4096  # Offset and size alignment required by O_DIRECT
+SMALL_FILE_SIZE = 1024 * 1024  # Files up to this size are read in one batch
+SMALL_FILES_MAX = 64 * 1024 * 1024  # Memory limit for batched small files
+
+Update = Callable[[Any], None]
+
+
+def pread(fd: int, length: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(fd, length, offset)
+    # Windows has no positional reads, every job uses its own descriptors so seeking is safe
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, length)
+
+
+def mount_of(path: Path) -> tuple[str, str] | None:
+    """Return the mount point and filesystem type holding `path` (Linux only)."""
+    try:
+        mounts = Path("/proc/self/mounts").read_bytes().splitlines()
+    except OSError:
+        return None
+
+    path = path.resolve()
+    best = None
+    for line in mounts:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        # Spaces and other special characters in mount points are octal-escaped
+        mount_point = re.sub(
+            rb"\\([0-7]{3})", lambda m: bytes([int(m[1], 8)]), fields[1]
+        ).decode()
+        if path.is_relative_to(mount_point) and (
+            not best or len(mount_point) > len(best[0])
+        ):
+            best = (mount_point, fields[2].decode())
+    return best
+
+
+def is_network_path(path: Path) -> bool:
+    return (mount := mount_of(path)) is not None and mount[1] in NETWORK_FILESYSTEMS
+
+
+def resolve_io_mode(mode: str, path: Path) -> str:
+    """Pick the I/O mode for `path` if it's set to auto."""
+    if mode != "auto":
+        return mode
+    return "network" if is_network_path(path) else "buffered"
+
+
+def short_read(path: Path) -> OSError:
+    return OSError(errno.EIO, "File is shorter than expected", str(path))
+
+
+def drop_cache(fd: int, offset: int = 0, length: int = 0) -> None:
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+
+class Reader:
+    """
+    Read file ranges for a single hashing job with plain buffered reads.
+
+    Every job uses its own reader, so file descriptors and buffers are never
+    shared between threads.
+    """
+
+    flags = os.O_RDONLY | getattr(os, "O_BINARY", 0)
+
+    def __init__(
+        self, read_size: int = READ_SIZE, small_files: dict[Path, bytes] | None = None
+    ):
+        self.read_size = read_size
+        self.small_files = small_files or {}
+        self._fds: dict[Path, int] = {}
+
+    def __enter__(self) -> Reader:
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def read_into(
+        self, update: Update, file: FileEntry, offset: int, length: int
+    ) -> None:
+        """Feed `length` bytes of `file` starting at `offset` to `update`."""
+        if (data := self.small_files.get(file.path)) is not None:
+            if len(data) < offset + length:
+                raise short_read(file.path)
+            update(memoryview(data)[offset : offset + length])
+            return
+
+        self._read_into(update, file.path, self._fd(file.path), offset, length)
+
+    def plan(self, segments: Iterable[tuple[FileEntry, int, int]]) -> None:
+        """Announce the segments the job is going to read, in order."""
+
+    def close(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def _fd(self, path: Path) -> int:
+        if path not in self._fds:
+            self._fds[path] = self._open(path)
+        return self._fds[path]
+
+    def _open(self, path: Path) -> int:
+        return os.open(path, self.flags)
+
+    def _read_into(
+        self, update: Update, path: Path, fd: int, offset: int, length: int
+    ) -> None:
+        end = offset + length
+        while offset < end:
+            data = pread(fd, min(self.read_size, end - offset), offset)
+            if not data:
+                raise short_read(path)
+            update(data)
+            offset += len(data)
+
+
+class SequentialReader(Reader):
+    """
+    Read into a reused page-aligned buffer without polluting the page cache.
+
+    Files are opened with a sequential access hint, and every range is
+    dropped from the page cache once it has been hashed, so hashing a large
+    release doesn't evict the pages used for seeding.
+    """
+
+    def __init__(
+        self, read_size: int = READ_SIZE, small_files: dict[Path, bytes] | None = None
+    ):
+        read_size = max(ALIGNMENT, read_size - read_size % ALIGNMENT)
+        super().__init__(read_size, small_files)
+        # Anonymous mappings are always page-aligned
+        self._buffer = mmap.mmap(-1, self.read_size)
+        self._consumed: dict[int, tuple[int, int]] = {}
+
+    def close(self) -> None:
+        # Pages still under readahead when first dropped are dropped again here
+        for fd, (start, end) in self._consumed.items():
+            drop_cache(fd, start, end - start)
+        self._consumed.clear()
+        super().close()
+        self._buffer.close()
+
+    def _consume(self, fd: int, offset: int, length: int) -> None:
+        drop_cache(fd, offset, length)
+        start, end = self._consumed.get(fd, (offset, offset + length))
+        self._consumed[fd] = (min(start, offset), max(end, offset + length))
+
+    def _open(self, path: Path) -> int:
+        fd = super()._open(path)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        return fd
+
+    def _read_into(
+        self, update: Update, path: Path, fd: int, offset: int, length: int
+    ) -> None:
+        with memoryview(self._buffer) as view:
+            pos, end = offset, offset + length
+            while pos < end:
+                n = os.preadv(fd, [view[: min(self.read_size, end - pos)]], pos)
+                if not n:
+                    raise short_read(path)
+                update(view[:n])
+                pos += n
+        self._consume(fd, offset, length)
+
+
+class DirectReader(SequentialReader):
+    """
+    Bypass the page cache with O_DIRECT.
+
+    Reads start at aligned offsets and cover whole aligned blocks, only the
+    requested part of each block is hashed. Filesystems without O_DIRECT
+    support fall back to sequential reads.
+    """
+
+    def _open(self, path: Path) -> int:
+        try:
+            return os.open(path, self.flags | os.O_DIRECT)
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+            return super()._open(path)
+
+    def _read_into(
+        self, update: Update, path: Path, fd: int, offset: int, length: int
+    ) -> None:
+        end = offset + length
+        pos = offset - offset % ALIGNMENT
+        with memoryview(self._buffer) as view:
+            while pos < end:
+                want = min(self.read_size, -(-(end - pos) // ALIGNMENT) * ALIGNMENT)
+                n = os.preadv(fd, [view[:want]], pos)
+                start, stop = max(offset - pos, 0), min(n, end - pos)
+                if stop <= start:
+                    raise short_read(path)
+                update(view[start:stop])
+                if n < want and pos + n < end:
+                    raise short_read(path)
+                pos += n
+        self._consume(fd, offset, length)
+
+
+class NetworkReader(Reader):
+    """
+    Keep several range reads in flight to hide the round-trip latency of network filesystems.
+
+    Reads are issued ahead in the order of the planned segments by a small
+    thread pool and handed out in the same order, so at most `depth` chunks
+    of `read_size` are buffered per job.
+    """
+
+    def __init__(
+        self,
+        read_size: int = READ_SIZE,
+        small_files: dict[Path, bytes] | None = None,
+        depth: int = PREFETCH_DEPTH,
+    ):
+        super().__init__(read_size, small_files)
+        self.depth = max(1, depth)
+        self._pool = ThreadPoolExecutor(max_workers=self.depth)
+        self._lock = threading.Lock()
+        self._chunks: Iterator[tuple[Path, int, int]] = iter(())
+        self._inflight: deque[tuple[tuple[Path, int, int], Future[bytes]]] = deque()
+
+    def plan(self, segments: Iterable[tuple[FileEntry, int, int]]) -> None:
+        def chunks() -> Iterator[tuple[Path, int, int]]:
+            for file, offset, length in segments:
+                if file.path in self.small_files:
+                    continue
+                end = offset + length
+                while offset < end:
+                    yield file.path, offset, min(self.read_size, end - offset)
+                    offset += self.read_size
+
+        self._chunks = chunks()
+        self._fill()
+
+    def close(self) -> None:
+        for _, future in self._inflight:
+            future.cancel()
+        self._inflight.clear()
+        self._pool.shutdown(wait=True)
+        super().close()
+
+    def _fd(self, path: Path) -> int:
+        with self._lock:
+            return super()._fd(path)
+
+    def _fill(self) -> None:
+        while len(self._inflight) < self.depth:
+            if (chunk := next(self._chunks, None)) is None:
+                return
+            self._inflight.append((chunk, self._pool.submit(self._fetch, *chunk)))
+
+    def _fetch(self, path: Path, offset: int, length: int) -> bytes:
+        fd = self._fd(path)
+        data = pread(fd, length, offset)
+        # Short reads are legal, only an empty read means end of file
+        while data and len(data) < length:
+            if not (more := pread(fd, length - len(data), offset + len(data))):
+                break
+            data += more
+        return data
+
+    def _read_into(
+        self, update: Update, path: Path, fd: int, offset: int, length: int
+    ) -> None:
+        end = offset + length
+        while offset < end:
+            if not self._inflight or self._inflight[0][0][:2] != (path, offset):
+                # Not planned, read it directly
+                super()._read_into(update, path, fd, offset, end - offset)
+                return
+            (_, _, chunk_length), future = self._inflight.popleft()
+            data = future.result()
+            self._fill()
+            if len(data) < chunk_length:
+                raise short_read(path)
+            update(data)
+            offset += len(data)
+
+
+def make_reader(
+    mode: str = "buffered",
+    read_size: int = READ_SIZE,
+    small_files: dict[Path, bytes] | None = None,
+    *,
+    prefetch: int = PREFETCH_DEPTH,
+) -> Reader:
+    if mode not in IO_MODES or mode == "auto":
+        raise ValueError(f"Unknown I/O mode {mode!r}, expected one of {IO_MODES[1:]}")
+    if mode == "network":
+        return NetworkReader(read_size, small_files, prefetch)
+    # Page cache hints need posix_fadvise and preadv, which are not available everywhere
+    if mode == "buffered" or not all(
+        hasattr(os, x) for x in ("posix_fadvise", "preadv")
+    ):
+        return Reader(read_size, small_files)
+    if mode == "direct" and hasattr(os, "O_DIRECT"):
+        return DirectReader(read_size, small_files)
+    return SequentialReader(read_size, small_files)
+
+
+def read_small_files(
+    files: Iterable[FileEntry], mode: str = "buffered"
+) -> dict[Path, bytes]:
+    """
+    Read small files (sidecars like .nfo or .srt) in one batch, ordered by inode.
+
+    Their pieces are then hashed from memory instead of every job opening
+    and reading them separately.
+    """
+    small_files: dict[Path, bytes] = {}
+    total = 0
+    for file in sorted(
+        {x.path: x for x in files if x.size <= SMALL_FILE_SIZE}.values(),
+        key=lambda x: x.identity,
+    ):
+        if total + file.size > SMALL_FILES_MAX:
+            break
+        chunks = []
+        done = 0
+        fd = os.open(file.path, Reader.flags)
+        try:
+            while done < file.size and (chunk := pread(fd, file.size - done, done)):
+                chunks.append(chunk)
+                done += len(chunk)
+            if mode in ("sequential", "direct"):
+                drop_cache(fd)
+        finally:
+            os.close(fd)
+        small_files[file.path] = b"".join(chunks)
+        total += file.size
+    return small_files
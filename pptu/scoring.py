@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from .snapshots import DEFAULT_SNAPSHOT_WORKERS, Snapshot, decode_frames, plan_jobs
+
+
+try:
+    import numpy as np
+except ImportError:  # Optional, only needed for snapshot candidates
+    np = None  # type: ignore[assignment]
+
+
+FRAME_SIZE = (144, 96)  # Width and height candidates are decoded at, a multiple of the dHash grid
+HASH_SIZE = (9, 8)  # dHash grid: 8 rows of 9 columns, compared horizontally
+MIN_LUMA = 24  # Mean luma of black frames and fades
+MIN_ENTROPY = 3.0  # Bits, of a 32 bin histogram, below which a frame is flat
+DUPLICATE_DISTANCE = 10  # dHash bits, below which two frames show the same scene
+
+
+def available() -> bool:
+    return np is not None
+
+
+def quality(frames: Any) -> Any:
+    """
+    Score a stack of grayscale frames, higher is better.
+
+    The score combines the entropy of the luma histogram and the edge
+    energy. Black, flat and overly bright frames get a negative score.
+    """
+    count = len(frames)
+    frames = frames.astype(np.int16)
+
+    # One histogram per frame in a single bincount, by offsetting the bins of every frame
+    bins = frames // 8 + np.arange(count)[:, None, None] * 32
+    hist = np.bincount(bins.ravel(), minlength=count * 32).reshape(count, 32)
+    p = hist / hist.sum(axis=1, keepdims=True)
+    entropy = -np.sum(np.where(p > 0, p * np.log2(np.where(p > 0, p, 1)), 0), axis=1)
+
+    edges = np.abs(np.diff(frames, axis=1)).mean(axis=(1, 2)) + np.abs(
+        np.diff(frames, axis=2)
+    ).mean(axis=(1, 2))
+    edges = edges / max(edges.max(), 1e-9)
+
+    luma = frames.mean(axis=(1, 2))
+    score = entropy / 5 + edges
+    bad = (luma < MIN_LUMA) | (luma > 255 - MIN_LUMA) | (entropy < MIN_ENTROPY)
+    return np.where(bad, score - 10, score)
+
+
+def dhash(frames: Any) -> Any:
+    """Return the 64-bit difference hashes of a stack of grayscale frames as boolean arrays."""
+    count, height, width = frames.shape
+    columns, rows = HASH_SIZE
+    blocks = frames.reshape(count, rows, height // rows, columns, width // columns)
+    means = blocks.mean(axis=(2, 4))
+    return (means[:, :, 1:] > means[:, :, :-1]).reshape(count, -1)
+
+
+def decode_candidates(
+    candidates: list[Snapshot],
+    *,
+    workers: int | None = None,
+    cpu_limit: int | None = None,
+) -> Any:
+    """Decode downscaled grayscale frames of candidates on a pool of ffmpeg processes."""
+    workers = max(1, workers or DEFAULT_SNAPSHOT_WORKERS)
+    threads = max(1, (cpu_limit or os.cpu_count() or 1) // workers)
+    width, height = FRAME_SIZE
+    jobs = plan_jobs(candidates, workers)
+
+    def decode(job: list[Snapshot]) -> list[bytes]:
+        return [
+            data
+            for _, _, data in decode_frames(
+                job, threads, filters=f"scale={width}:{height}", gray=True
+            )
+        ]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = {
+            x: data
+            for job, results in zip(jobs, pool.map(decode, jobs), strict=True)
+            for x, data in zip(job, results, strict=True)
+        }
+    return np.stack(
+        [np.frombuffer(frames[x], np.uint8).reshape(height, width) for x in candidates]
+    )
+
+
+def pick_candidates(
+    slots: list[list[Snapshot]],
+    *,
+    workers: int | None = None,
+    cpu_limit: int | None = None,
+) -> list[Snapshot]:
+    """
+    Pick the best candidate for every snapshot slot.
+
+    All candidates are decoded downscaled in one pass and scored at once.
+    Slots are then filled in order, candidates looking like a frame picked
+    for an earlier slot are only used when nothing else is left.
+    """
+    candidates = [x for slot in slots for x in slot]
+    frames = decode_candidates(candidates, workers=workers, cpu_limit=cpu_limit)
+    scores = quality(frames)
+    hashes = dhash(frames)
+
+    picked: list[Snapshot] = []
+    picked_hashes: list[Any] = []
+    start = 0
+    for slot in slots:
+        indexes = np.arange(start, start + len(slot))
+        start += len(slot)
+        slot_scores = scores[indexes].copy()
+        if picked_hashes:
+            distances = (hashes[indexes][:, None, :] != np.array(picked_hashes)[None]).sum(
+                axis=2
+            )
+            slot_scores[distances.min(axis=1) < DUPLICATE_DISTANCE] -= 5
+        best = indexes[int(np.argmax(slot_scores))]
+        picked.append(candidates[best])
+        picked_hashes.append(hashes[best])
+    return picked
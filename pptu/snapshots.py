@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, IO, Iterator, NamedTuple
+
+import oxipng
+
+from .utils import write_atomic
+
+
+DEFAULT_SNAPSHOT_WORKERS = min(4, os.cpu_count() or 1)
+SCALE_FILTER = "scale='max(sar,1)*iw':'max(1/sar,1)*ih'"  # Square pixels
+PROBE_WINDOW = 10  # Seconds of packets read after a timestamp to find keyframes around it
+KEYFRAME_SEEK_SLACK = 0.001  # Seconds added to keyframe timestamps against rounding
+
+
+class Snapshot(NamedTuple):
+    path: Path  # PNG written to the cache directory
+    source: Path
+    timestamp: float  # Seconds
+    keyframe: bool = False  # Whether the timestamp is exactly on a keyframe
+
+
+class KeyframeIndex:
+    """
+    Keyframe timestamps of source files, cached as JSON.
+
+    Keyframes are found with ffprobe from packet flags, only around the
+    timestamps asked for: ffprobe seeks to every timestamp, which lands on
+    the keyframe before it, and reads PROBE_WINDOW seconds from there.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            self._files = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            self._files = {}
+
+    def snap(self, source: Path, timestamps: list[float]) -> list[float | None]:
+        """Return the keyframe nearest to every timestamp, relative to the start of the file."""
+        st = os.stat(source)
+        entry = self._files.get(str(source))
+        if not entry or entry["identity"] != [st.st_size, st.st_mtime_ns]:
+            entry = self._files[str(source)] = {
+                "identity": [st.st_size, st.st_mtime_ns],
+                "start": 0.0,
+                "keyframes": [],
+                "probed": [],
+            }
+
+        if missing := sorted({round(x, 3) for x in timestamps} - set(entry["probed"])):
+            entry["start"], keyframes = self._probe(source, missing)
+            entry["keyframes"] = sorted({*entry["keyframes"], *keyframes})
+            entry["probed"] = sorted({*entry["probed"], *missing})
+            self.path.write_text(json.dumps(self._files))
+
+        keyframes = entry["keyframes"]
+        result: list[float | None] = []
+        for timestamp in timestamps:
+            target = timestamp + entry["start"]
+            i = bisect.bisect_left(keyframes, target)
+            near = [
+                x
+                for x in keyframes[max(0, i - 1) : i + 1]
+                if abs(x - target) <= PROBE_WINDOW
+            ]
+            nearest = min(near, key=lambda x: abs(x - target), default=None)
+            result.append(None if nearest is None else nearest - entry["start"])
+        return result
+
+    @staticmethod
+    def _probe(source: Path, timestamps: list[float]) -> tuple[float, list[float]]:
+        output = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "V:0",
+                "-read_intervals",
+                ",".join(f"{x}%+{PROBE_WINDOW}" for x in timestamps),
+                "-show_entries",
+                "packet=pts_time,flags:format=start_time",
+                "-of",
+                "json",
+                str(source),
+            ],
+            capture_output=True,
+            check=True,
+        ).stdout
+        probe = json.loads(output)
+        return float(probe.get("format", {}).get("start_time", 0)), [
+            float(x["pts_time"])
+            for x in probe.get("packets", [])
+            if "K" in x.get("flags", "") and x.get("pts_time") not in (None, "N/A")
+        ]
+
+
+def read_ppm(stream: IO[bytes]) -> tuple[int, int, bytes] | None:
+    """Read one binary 8-bit PPM (RGB) or PGM (grayscale) frame, return its width, height and data."""
+    fields: list[bytes] = []
+    token = b""
+    while len(fields) < 4:
+        if not (char := stream.read(1)):
+            return None
+        if char.isspace():
+            if token:
+                fields.append(token)
+                token = b""
+        else:
+            token += char
+    # The whitespace after the maximum value ends the header
+    magic, width, height, maxval = fields
+    if magic not in (b"P5", b"P6") or maxval != b"255":
+        raise ValueError(f"Unexpected frame format: {b' '.join(fields)!r}")
+    size = int(width) * int(height) * (3 if magic == b"P6" else 1)
+    data = stream.read(size)
+    if len(data) != size:
+        return None
+    return int(width), int(height), data
+
+
+def decode_frames(
+    snapshots: list[Snapshot],
+    threads: int = 0,
+    *,
+    filters: str = SCALE_FILTER,
+    gray: bool = False,
+) -> Iterator[tuple[int, int, bytes]]:
+    """
+    Decode the frames at the timestamps of snapshots with a single ffmpeg process.
+
+    Every timestamp is an input of its own seeking directly to it, so
+    nothing between them is decoded. Timestamps on a keyframe only decode
+    that keyframe. The frames are passed through `filters`, converted to
+    8-bit RGB (or grayscale) and read one after another from a pipe.
+    """
+    args = ["ffmpeg", "-v", "error"]
+    for snapshot in snapshots:
+        args += ["-threads", str(threads)]
+        if snapshot.keyframe:
+            # Seek to the keyframe and decode nothing else
+            args += [
+                "-noaccurate_seek",
+                "-skip_frame",
+                "nokey",
+                "-ss",
+                str(snapshot.timestamp + KEYFRAME_SEEK_SLACK),
+            ]
+        else:
+            args += ["-ss", str(snapshot.timestamp)]
+        args += ["-i", str(snapshot.source)]
+
+    pix_fmt, codec = ("gray", "pgm") if gray else ("rgb24", "ppm")
+    # V skips cover art, which is a video stream in MP4
+    graph = "".join(
+        f"[{i}:V:0]trim=end_frame=1,setpts=PTS-STARTPTS,{filters},format={pix_fmt}[v{i}];"
+        for i in range(len(snapshots))
+    )
+    graph += "".join(f"[v{i}]" for i in range(len(snapshots)))
+    graph += f"concat=n={len(snapshots)}:v=1:a=0[out]"
+    args += [
+        "-filter_complex",
+        graph,
+        "-map",
+        "[out]",
+        "-f",
+        "image2pipe",
+        "-c:v",
+        codec,
+        "pipe:1",
+    ]
+
+    done = 0
+    with subprocess.Popen(args, stdout=subprocess.PIPE) as process:
+        assert process.stdout
+        while done < len(snapshots) and (frame := read_ppm(process.stdout)):
+            done += 1
+            yield frame
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
+    if done != len(snapshots):
+        raise RuntimeError(f"ffmpeg returned {done} of {len(snapshots)} frames")
+
+
+def extract_batch(
+    snapshots: list[Snapshot],
+    threads: int = 0,
+    callback: Callable[[Snapshot], None] | None = None,
+    png: dict[str, Any] | None = None,
+) -> None:
+    """
+    Write the frames at the timestamps of snapshots as 8-bit, optimized PNGs.
+
+    Every frame is encoded to PNG once as soon as it's decoded, so one raw
+    frame per job is kept in memory.
+    """
+    # The decoder comes first, so it runs to the end and checks ffmpeg's exit code
+    for (width, height, data), snapshot in zip(
+        decode_frames(snapshots, threads), snapshots, strict=True
+    ):
+        write_atomic(
+            snapshot.path,
+            oxipng.RawImage(
+                data, width, height, color_type=oxipng.ColorType.rgb()
+            ).create_optimized_png(**(png or {})),
+        )
+        if callback:
+            callback(snapshot)
+
+
+def plan_jobs(
+    snapshots: list[Snapshot], workers: int, *, batch: bool = True
+) -> list[list[Snapshot]]:
+    """
+    Group snapshots into ffmpeg jobs.
+
+    With `batch`, snapshots of the same source share a job, split into
+    enough jobs to keep every worker busy. Otherwise every snapshot is a
+    job of its own.
+    """
+    if not batch:
+        return [[x] for x in snapshots]
+
+    sources: dict[Path, list[Snapshot]] = {}
+    for snapshot in snapshots:
+        sources.setdefault(snapshot.source, []).append(snapshot)
+    per_job = max(1, -(-len(snapshots) // workers))
+    return [
+        group[i : i + per_job]
+        for group in sources.values()
+        for i in range(0, len(group), per_job)
+    ]
+
+
+def extract_snapshots(
+    snapshots: list[Snapshot],
+    *,
+    workers: int | None = None,
+    cpu_limit: int | None = None,
+    batch: bool = True,
+    png: dict[str, Any] | None = None,
+    callback: Callable[[Snapshot], None] | None = None,
+) -> list[Path]:
+    """
+    Extract snapshots on a pool of `workers` ffmpeg processes.
+
+    Every process gets an equal share of `cpu_limit` decoding threads, so the
+    pool as a whole stays within it. `png` are oxipng options, see
+    `png_options`. Cached snapshots are skipped, the result
+    is in the order of `snapshots` regardless of which job finishes first.
+    """
+    workers = max(1, workers or DEFAULT_SNAPSHOT_WORKERS)
+    threads = max(1, (cpu_limit or os.cpu_count() or 1) // workers)
+    jobs = plan_jobs([x for x in snapshots if not x.path.exists()], workers, batch=batch)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extract_batch, x, threads, callback, png) for x in jobs]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # Don't wait for the remaining snapshots on errors or Ctrl-C
+            for future in futures:
+                future.cancel()
+            raise
+
+    return [x.path for x in snapshots]
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+import oxipng
+from platformdirs import PlatformDirs
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TaskProgressColumn, TextColumn, TimeRemainingColumn
+from wand.image import Image
+
+from .png import DEFAULT_PNG_PROFILE, png_key, png_options
+from .snapshots import DEFAULT_SNAPSHOT_WORKERS
+from .utils import known_png_profile, print, write_atomic
+
+
+class Thumbnail(NamedTuple):
+    width: int
+    file_type: str = "png"
+
+
+def snapshot_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fd:
+        while chunk := fd.read(1024**2):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def thumbnail_path(
+    directory: Path, digest: str, thumbnail: Thumbnail, png_name: str
+) -> Path:
+    # PNG thumbnails differ by the profile they're optimized with
+    suffix = f"_{png_name}" if thumbnail.file_type == "png" else ""
+    return directory / f"{digest[:32]}_{thumbnail.width}{suffix}.{thumbnail.file_type}"
+
+
+def render_thumbnails(
+    snapshot: Path,
+    thumbnails: list[Thumbnail],
+    directory: Path,
+    png: dict[str, Any],
+    png_name: str,
+) -> dict[Thumbnail, Path]:
+    """
+    Write the thumbnails of a snapshot that aren't cached yet.
+
+    The snapshot is decoded once, every thumbnail is resized from the full
+    size image. PNG thumbnails are optimized before they're written.
+    """
+    digest = snapshot_hash(snapshot)
+    paths = {
+        x: thumbnail_path(directory, digest, x, png_name) for x in dict.fromkeys(thumbnails)
+    }
+    if missing := [x for x, path in paths.items() if not path.exists()]:
+        with Image(filename=snapshot) as img:
+            for thumbnail in missing:
+                with img.clone() as thumb:
+                    height = round(img.height / (img.width / thumbnail.width))
+                    thumb.resize(thumbnail.width, height)
+                    thumb.depth = 8
+                    data = thumb.make_blob(thumbnail.file_type)
+                if thumbnail.file_type == "png":
+                    data = oxipng.optimize_from_memory(data, **png)
+                write_atomic(paths[thumbnail], data)
+    return paths
+
+
+def create_thumbnails(
+    jobs: dict[Path, list[Thumbnail]],
+    directory: Path,
+    *,
+    workers: int | None = None,
+    png_profile: str = DEFAULT_PNG_PROFILE,
+    png_zopfli: int | None = None,
+    callback: Callable[[Path], None] | None = None,
+) -> dict[tuple[Path, Thumbnail], Path]:
+    """
+    Generate every thumbnail of every snapshot on a pool of `workers` threads.
+
+    Thumbnails are cached in `directory` by the hash of the snapshot, their
+    width, format and PNG profile, so any tracker needing the same one finds it there.
+    """
+    png = png_options(png_profile, png_zopfli)
+    png_name = png_key(png_profile, png_zopfli)
+    directory.mkdir(parents=True, exist_ok=True)
+    result: dict[tuple[Path, Thumbnail], Path] = {}
+    workers = max(1, workers or DEFAULT_SNAPSHOT_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_thumbnails, x, thumbnails, directory, png, png_name): x
+            for x, thumbnails in jobs.items()
+        }
+        try:
+            for future in as_completed(futures):
+                snapshot = futures[future]
+                for thumbnail, path in future.result().items():
+                    result[snapshot, thumbnail] = path
+                if callback:
+                    callback(snapshot)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return result
+
+
+def generate_thumbnails(
+    snapshots: list[Path],
+    width: int = 300,
+    file_type: str = "png",
+    *,
+    progress_obj: Progress | None = None,
+    png_profile: str | None = None,
+    png_zopfli: int | None = None,
+) -> list[Path]:
+    width = int(width)
+    print(f"Using thumbnail width: [bold cyan]{width}[/]")
+
+    thumbnail = Thumbnail(width, file_type)
+    with progress_obj or Progress(
+        TextColumn("[progress.description]{task.description}[/]"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TaskProgressColumn(),
+        TimeRemainingColumn(elapsed_when_finished=True),
+    ) as progress:
+        task = progress.add_task(
+            description="Generating thumbnails", total=len(set(snapshots))
+        )
+        thumbnails = create_thumbnails(
+            {x: [thumbnail] for x in snapshots},
+            PlatformDirs(appname="pptu", appauthor=False).user_cache_path
+            / "thumbnails",
+            png_profile=known_png_profile(png_profile),
+            png_zopfli=png_zopfli,
+            callback=lambda _: progress.update(task, advance=1),
+        )
+
+    return [thumbnails[x, thumbnail] for x in snapshots]
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple
+
+from .hashing import FileEntry, Layout, PieceHasher
+from .readers import PREFETCH_DEPTH, READ_SIZE
+
+
+if TYPE_CHECKING:
+    from torf import Torrent
+
+    from .checksums import FileDigests
+
+
+TORRENT_VERSIONS = ("v1", "v2", "hybrid")
+BLOCK_SIZE = 16 * 1024  # Leaf size of the per-file Merkle trees
+ZERO_HASH = bytes(32)
+
+
+def bencode(value: Any) -> bytes:
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, (bytes, bytearray)):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(x) for x in value) + b"e"
+    if isinstance(value, dict):
+        items = sorted((k.encode() if isinstance(k, str) else k, v) for k, v in value.items())
+        return b"d" + b"".join(bencode(k) + bencode(v) for k, v in items) + b"e"
+    raise TypeError(f"Can't bencode {type(value).__name__}")
+
+
+def merkle_root(nodes: list[bytes], width: int, pad: bytes = ZERO_HASH) -> bytes:
+    """Root of a Merkle tree over `nodes`, padded with `pad` to `width` nodes."""
+    layer = nodes + [pad] * (width - len(nodes))
+    while len(layer) > 1:
+        layer = [
+            hashlib.sha256(layer[i] + layer[i + 1]).digest()
+            for i in range(0, len(layer), 2)
+        ]
+    return layer[0]
+
+
+def next_pow2(n: int) -> int:
+    return 1 << max(0, n - 1).bit_length()
+
+
+class PieceHash:
+    """
+    Hash object for one piece of a v2 or hybrid torrent, used with PieceHasher.
+
+    `digest` packs four hashes: the Merkle root of the piece padded to a full
+    piece, the root padded to the next power of two (the pieces root of files
+    up to one piece long), and the v1 SHA-1 with and without zero padding.
+    """
+
+    def __init__(self, piece_size: int):
+        self.piece_size = piece_size
+        self._sha1 = hashlib.sha1()
+        self._leaves: list[bytes] = []
+        self._buffer = bytearray()
+        self._length = 0
+
+    def update(self, data: Any) -> None:
+        self._sha1.update(data)
+        self._length += len(data)
+
+        view = memoryview(data)
+        if self._buffer:
+            take = BLOCK_SIZE - len(self._buffer)
+            self._buffer += view[:take]
+            view = view[take:]
+            if len(self._buffer) < BLOCK_SIZE:
+                return
+            self._leaves.append(hashlib.sha256(self._buffer).digest())
+            self._buffer.clear()
+        while len(view) >= BLOCK_SIZE:
+            self._leaves.append(hashlib.sha256(view[:BLOCK_SIZE]).digest())
+            view = view[BLOCK_SIZE:]
+        self._buffer += view
+
+    def digest(self) -> bytes:
+        leaves = self._leaves[:]
+        if self._buffer:
+            leaves.append(hashlib.sha256(self._buffer).digest())
+        padded = self._sha1.copy()
+        padded.update(bytes(self.piece_size - self._length))
+        return (
+            merkle_root(leaves, self.piece_size // BLOCK_SIZE)
+            + merkle_root(leaves, next_pow2(len(leaves)))
+            + self._sha1.digest()
+            + padded.digest()
+        )
+
+
+class FileHashes(NamedTuple):
+    root: bytes  # Pieces root
+    layer: bytes  # Piece layer, empty for files up to one piece long
+    v1: bytes  # v1 piece hashes, the last piece padded with zeros
+    v1_tail: bytes  # v1 hash of the last piece without padding, for single-file torrents
+
+
+class V2File(NamedTuple):
+    path: tuple[str, ...]  # Path components below the torrent's name
+    size: int
+    hashes: FileHashes | None  # None for empty files
+
+
+class FileHashStore:
+    """
+    Persistent per-file Merkle roots, piece layers and piece-aligned v1 hashes.
+
+    Files are keyed by device, inode, size, mtime and piece size only. As v2
+    pieces never span files, a season torrent can be assembled from episodes
+    hashed before without reading them again.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files_v2 (key BLOB PRIMARY KEY,"
+            " root BLOB NOT NULL, layer BLOB NOT NULL, v1 BLOB NOT NULL,"
+            " v1_tail BLOB NOT NULL)"
+        )
+
+    @staticmethod
+    def key(identity: tuple[int, ...], piece_size: int) -> bytes:
+        return hashlib.sha1(repr((identity, piece_size)).encode()).digest()
+
+    def get(self, key: bytes) -> FileHashes | None:
+        row = self._db.execute(
+            "SELECT root, layer, v1, v1_tail FROM files_v2 WHERE key = ?", (key,)
+        ).fetchone()
+        return FileHashes(*row) if row else None
+
+    def put(self, items: list[tuple[bytes, FileHashes]]) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files_v2 VALUES (?, ?, ?, ?, ?)",
+                [(key, *hashes) for key, hashes in items],
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def v2_layout(torrent: Torrent) -> tuple[list[tuple[str, ...]], Layout]:
+    """Return the file paths below the torrent's name and the aligned layout, in v2 order."""
+    assert torrent.path is not None
+    root = Path(torrent.path)
+    paths: dict[tuple[str, ...], Path]
+    if root.is_file():
+        paths = {(root.name,): root}
+    else:
+        paths = {Path(x).relative_to(root).parts: Path(x) for x in torrent.filepaths}
+    # v2 file trees are sorted by name, v1 files of hybrids must use the same order
+    order = sorted(paths, key=lambda x: [y.encode() for y in x])
+    return order, Layout([paths[x] for x in order], torrent.piece_size, aligned=True)
+
+
+def file_pieces(file: FileEntry, piece_size: int) -> range:
+    """Pieces of an aligned layout covering `file`."""
+    return range(file.offset // piece_size, -(-(file.offset + file.size) // piece_size))
+
+
+def file_hashes(layout: Layout, file: FileEntry, digests: dict[int, bytes]) -> FileHashes:
+    """Combine the PieceHash digests of a file's pieces."""
+    file_digests = [digests[x] for x in file_pieces(file, layout.piece_size)]
+    piece_roots = [x[:32] for x in file_digests]
+    if len(piece_roots) == 1:
+        root, layer = file_digests[0][32:64], b""
+    else:
+        pad = merkle_root([], layout.piece_size // BLOCK_SIZE)
+        root = merkle_root(piece_roots, next_pow2(len(piece_roots)), pad)
+        layer = b"".join(piece_roots)
+    return FileHashes(
+        root,
+        layer,
+        b"".join(x[84:104] for x in file_digests),
+        file_digests[-1][64:84],
+    )
+
+
+class V2Hasher:
+    """Hash the files of a torrent for v2 or hybrid metainfo, file by file."""
+
+    def __init__(
+        self,
+        torrent: Torrent,
+        *,
+        workers: int | None = None,
+        io_mode: str = "buffered",
+        read_size: int = READ_SIZE,
+        prefetch: int = PREFETCH_DEPTH,
+        store: FileHashStore | None = None,
+        digests: FileDigests | None = None,
+    ):
+        self.workers = workers
+        self.io_mode = io_mode
+        self.read_size = read_size
+        self.prefetch = prefetch
+        self.store = store
+        self.digests = digests
+
+        self.paths, self.layout = v2_layout(torrent)
+
+        self.hashes: dict[int, FileHashes] = {}
+        self.missing: list[int] = []
+        for i, file in enumerate(self.layout.files):
+            if not file.size:
+                continue
+            key = FileHashStore.key(file.identity, self.layout.piece_size)
+            if store and (hashes := store.get(key)):
+                self.hashes[i] = hashes
+            else:
+                self.missing.append(i)
+
+        # Files with cached hashes still have to be read for missing digests
+        self.to_read = sorted(self.missing)
+        if digests:
+            wanted = {x.path for x in digests.prepare(self.layout.files)}
+            self.to_read = [
+                i
+                for i, file in enumerate(self.layout.files)
+                if i in self.missing or file.path in wanted
+            ]
+
+    @property
+    def pending(self) -> int:
+        """Number of bytes that have to be read."""
+        return sum(self.layout.files[i].size for i in self.to_read)
+
+    def run(self, callback: Callable[[Path, int], None] | None = None) -> list[V2File]:
+        piece_size = self.layout.piece_size
+
+        digests = PieceHasher(
+            self.layout,
+            workers=self.workers,
+            io_mode=self.io_mode,
+            read_size=self.read_size,
+            prefetch=self.prefetch,
+            hash_factory=lambda: PieceHash(piece_size),
+            callback=callback,
+            digests=self.digests,
+        ).hash(x for i in self.to_read for x in file_pieces(self.layout.files[i], piece_size))
+
+        new = []
+        for i in self.missing:
+            file = self.layout.files[i]
+            self.hashes[i] = file_hashes(self.layout, file, digests)
+            new.append((FileHashStore.key(file.identity, piece_size), self.hashes[i]))
+        if self.store:
+            self.store.put(new)
+
+        return [
+            V2File(path, file.size, self.hashes.get(i))
+            for i, (path, file) in enumerate(
+                zip(self.paths, self.layout.files, strict=True)
+            )
+        ]
+
+
+def metainfo(
+    files: list[V2File],
+    *,
+    name: str,
+    piece_size: int,
+    hybrid: bool,
+    trackers: list[str],
+    private: bool = True,
+    source: str | None = None,
+    entropy: Any = None,
+) -> dict[str, Any]:
+    """Build the metainfo of a v2 or hybrid torrent."""
+    single = len(files) == 1 and files[0].path == (name,)
+
+    file_tree: dict[str, Any] = {}
+    for file in files:
+        node = file_tree
+        for part in file.path:
+            node = node.setdefault(part, {})
+        node[""] = {"length": file.size}
+        if file.hashes:
+            node[""]["pieces root"] = file.hashes.root
+
+    info: dict[str, Any] = {
+        "name": name,
+        "piece length": piece_size,
+        "meta version": 2,
+        "file tree": file_tree,
+    }
+    if private:
+        info["private"] = 1
+    if source:
+        info["source"] = source
+    if entropy is not None:
+        info["entropy"] = entropy
+
+    if hybrid:
+        if single:
+            hashes = files[0].hashes
+            info["length"] = files[0].size
+            info["pieces"] = hashes.v1[:-20] + hashes.v1_tail if hashes else b""
+        else:
+            # Every file is padded to a piece boundary, so v1 pieces never span files
+            v1_files = []
+            for file in files:
+                v1_files.append({"length": file.size, "path": list(file.path)})
+                if pad := -file.size % piece_size:
+                    v1_files.append(
+                        {"attr": "p", "length": pad, "path": [".pad", str(pad)]}
+                    )
+            info["files"] = v1_files
+            info["pieces"] = b"".join(x.hashes.v1 for x in files if x.hashes)
+
+    metainfo: dict[str, Any] = {
+        "info": info,
+        "piece layers": {
+            x.hashes.root: x.hashes.layer
+            for x in files
+            if x.hashes and x.hashes.layer
+        },
+    }
+    if trackers:
+        metainfo["announce"] = trackers[0]
+        if len(trackers) > 1:
+            metainfo["announce-list"] = [[x] for x in trackers]
+    return metainfo
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+from .hashing import Layout, PieceHasher
+from .readers import PREFETCH_DEPTH, drop_cache, is_network_path, mount_of
+
+
+SAMPLE_SIZE = 256 * 1024 * 1024  # Bytes hashed per benchmarked setting
+PIECE_SIZE = 4 * 1024 * 1024
+WORKERS = (1, 2, 4, 8)
+READ_SIZES = (1024**2, 4 * 1024**2, 16 * 1024**2)
+LOCAL_IO_MODES = ("buffered", "sequential", "direct")
+PREFETCH_DEPTHS = (4, 8, 16)
+
+
+class IoSettings(NamedTuple):
+    io_mode: str
+    workers: int
+    read_size: int
+    prefetch: int = PREFETCH_DEPTH
+
+
+def device_key(path: Path) -> str:
+    """Identify the device holding `path` by its mount point, or its st_dev without /proc."""
+    if mount := mount_of(path):
+        return f"mount:{mount[0]}"
+    return f"dev:{os.stat(path).st_dev}"
+
+
+def settings_grid(path: Path) -> list[IoSettings]:
+    """Settings to benchmark, network filesystems only use the network mode."""
+    workers = [x for x in WORKERS if x <= 2 * (os.cpu_count() or 1)]
+    if is_network_path(path):
+        return [
+            IoSettings("network", *x)
+            for x in itertools.product(workers, READ_SIZES, PREFETCH_DEPTHS)
+        ]
+    return [
+        IoSettings(*x) for x in itertools.product(LOCAL_IO_MODES, workers, READ_SIZES)
+    ]
+
+
+class TuningStore:
+    """Best hashing I/O settings per device, in a JSON file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            self._profiles = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            self._profiles = {}
+
+    def get(self, path: Path) -> IoSettings | None:
+        try:
+            profile = self._profiles.get(device_key(path))
+        except OSError:
+            return None
+        return IoSettings(**profile["settings"]) if profile else None
+
+    def put(self, path: Path, settings: IoSettings, throughput: float) -> None:
+        self._profiles[device_key(path)] = {
+            "settings": settings._asdict(),
+            "throughput": throughput,
+            "tuned": int(time.time()),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self._profiles, indent=2))
+
+
+def sample_files(path: Path) -> list[Path]:
+    """Return the files below `path`, largest first, as the data to read."""
+    if path.is_file():
+        return [path]
+    files = [x for x in path.rglob("*") if x.is_file() and not x.is_symlink()]
+    return sorted(files, key=lambda x: x.stat().st_size, reverse=True)
+
+
+class IoBenchmark:
+    """
+    Hash existing data on a device with every setting of a grid.
+
+    Every setting reads a different window of the data when there's enough
+    of it, and the window is dropped from the page cache first, so later
+    runs don't just hash cached data.
+    """
+
+    def __init__(self, path: Path, *, sample_size: int = SAMPLE_SIZE):
+        self.path = path
+        self.layout = Layout(sample_files(path), PIECE_SIZE)
+        if not self.layout.size:
+            raise ValueError(f"No data to read below {path}")
+        self.sample_pieces = max(1, min(self.layout.pieces, sample_size // PIECE_SIZE))
+        self._windows = itertools.cycle(
+            range(0, self.layout.pieces - self.sample_pieces + 1, self.sample_pieces)
+        )
+
+    def run(self, grid: list[IoSettings]) -> Iterator[tuple[IoSettings, float]]:
+        """Yield every setting with its throughput in bytes per second."""
+        for settings in grid:
+            start = next(self._windows)
+            pieces = range(start, start + self.sample_pieces)
+            self._evict(pieces)
+
+            hasher = PieceHasher(
+                self.layout,
+                workers=settings.workers,
+                io_mode=settings.io_mode,
+                read_size=settings.read_size,
+                prefetch=settings.prefetch,
+            )
+            begin = time.perf_counter()
+            hasher.hash(pieces)
+            elapsed = time.perf_counter() - begin
+
+            size = sum(x[2] for piece in pieces for x in self.layout.segments(piece))
+            yield settings, size / max(elapsed, 1e-9)
+
+    def _evict(self, pieces: range) -> None:
+        files = {x[0].path for piece in pieces for x in self.layout.segments(piece)}
+        for file in files:
+            fd = os.open(file, os.O_RDONLY)
+            try:
+                drop_cache(fd)
+            finally:
+                os.close(fd)
@@ -26,6 +26,7 @@ if TYPE_CHECKING:
 class AvistaZNetworkUploader(Uploader, ABC):
     min_snapshots: int = 3
     random_snapshots: bool = True
+    mosaic_snapshots: bool = False  # Screenshots are uploaded one by one to the torrent
     exclude_regexs: str = r".*\.(ffindex|jpg|png|srt|nfo|torrent|txt)$"
 
     year_in_series_name: bool = False
@@ -16,6 +16,8 @@ from ..utils import Config, eprint
 if TYPE_CHECKING:
     from pathlib import Path
 
+    from ..thumbnails import Thumbnail
+
 
 class Uploader(ABC):
     name: str  # Name of the tracker
@@ -27,6 +29,7 @@ class Uploader(ABC):
     min_snapshots: int = 0
     snapshots_plus: int = 0 # Number of extra snapshots to generate
     random_snapshots: bool = False
+    mosaic_snapshots: bool = True  # Whether snapshots can be tiled into a contact sheet
     mediainfo: bool = True
 
     def __init__(self) -> None:
@@ -83,6 +86,13 @@ class Uploader(ABC):
         """
         return None
 
+    def thumbnails(self, snapshots: list[Path]) -> dict[Thumbnail, list[Path]]:
+        """
+        Thumbnails the description is going to link, by width and format.
+        They're generated for all trackers at once, before preparing the uploads.
+        """
+        return {}
+
     @abstractmethod
     def prepare(
         self,
@@ -12,7 +12,9 @@ from langcodes import Language
 from pyotp import TOTP
 from rich.prompt import Prompt
 
-from ..utils import Img, eprint, find, generate_thumbnails, load_html, print, wprint
+from ..imagehosts import Img
+from ..thumbnails import Thumbnail, generate_thumbnails
+from ..utils import eprint, find, load_html, print, wprint
 from . import Uploader
 
 
@@ -148,6 +150,20 @@ class BroadcasTheNetUploader(Uploader):
             return None
         return el.attrs["value"].split("/")[-2]
 
+    def _thumbnail_width(self) -> int:
+        thumbnail_row_width = int(min(530, self.config.get(self, "snapshot_row_width", 530)))
+        if self.config.get(self, "snapshot_mosaic"):
+            # A contact sheet takes the whole row
+            return thumbnail_row_width
+        return int(
+            thumbnail_row_width / self.config.get(self, "snapshot_columns", 2) - 5
+        )
+
+    def thumbnails(self, snapshots: list[Path]) -> dict[Thumbnail, list[Path]]:
+        if not self.config.get(self, "img_uploader"):
+            return {}
+        return {Thumbnail(self._thumbnail_width(), "jpg"): snapshots}
+
     def login(self, *, auto: Any) -> bool:
         # Allow cookies from either broadcasthe.net or backup.landof.tv
         for cookie in self.session.cookies:
@@ -337,25 +353,27 @@ class BroadcasTheNetUploader(Uploader):
         if self.config.get(self, "img_uploader"):
             uploader = Img(self)
             snapshot_urls = []
-            for snap in uploader.upload(snapshots):
+            if (uploaded := uploader.upload(snapshots)) is None:
+                return False
+            for snap in uploaded:
                 snapshot_urls.append(
                     f"https://i.kek.sh/{snap['filename']}"
                     if snap.get("filename")
                     else ""
                 )
 
-            thumbnail_row_width = min(
-                530, self.config.get(self, "snapshot_row_width", 530)
-            )
-            thumbnail_width = (
-                thumbnail_row_width / self.config.get(self, "snapshot_columns", 2)
-            ) - 5
             thumbnail_urls = []
             thumbnails = generate_thumbnails(
-                snapshots, file_type="jpg", width=thumbnail_width
+                snapshots,
+                file_type="jpg",
+                width=self._thumbnail_width(),
+                png_profile=self.config.get(self, "png_profile"),
+                png_zopfli=self.config.get(self, "png_zopfli"),
             )
 
-            for thumb in uploader.upload(thumbnails):
+            if (uploaded := uploader.upload(thumbnails)) is None:
+                return False
+            for thumb in uploaded:
                 thumbnail_urls.append(
                     f"https://i.kek.sh/{thumb['filename']}"
                     if thumb.get("filename")
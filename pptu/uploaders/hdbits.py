@@ -11,7 +11,8 @@ from imdb import Cinemagoer
 from pyotp import TOTP
 from rich.prompt import Prompt
 
-from ..utils import Img, eprint, load_html, print, wprint
+from ..imagehosts import Img
+from ..utils import eprint, load_html, print, wprint
 from . import Uploader
 
 
@@ -314,12 +315,20 @@ class HDBitsUploader(Uploader):
             thumbnail_row_width / self.config.get(self, "snapshot_columns", 2)
         ) - 5
         thumbnail_width = max(x for x in allowed_widths if x <= thumbnail_width)
+        # A contact sheet takes the whole row
+        mosaic = bool(self.config.get(self, "snapshot_mosaic"))
+        if mosaic:
+            thumbnail_width = max(x for x in allowed_widths if x <= thumbnail_row_width)
 
         thumbnails_str = ""
         uploader = Img(self)
-        for i, url in enumerate(uploader.upload(snapshots, thumbnail_width, name)):
+        if (uploaded := uploader.upload(snapshots, thumbnail_width, name)) is None:
+            return False
+        for i, url in enumerate(uploaded):
             thumbnails_str += url
-            if i % self.config.get(self, "snapshot_columns", 2) == 0:
+            if mosaic:
+                thumbnails_str += "\n"
+            elif i % self.config.get(self, "snapshot_columns", 2) == 0:
                 thumbnails_str += " "
             else:
                 thumbnails_str += "\n"
@@ -15,7 +15,9 @@ from pyotp import TOTP
 from rich.prompt import Prompt
 from rich.status import Status
 
-from ..utils import Img, eprint, find, first, first_or_none, generate_thumbnails, load_html, print, wprint
+from ..imagehosts import Img
+from ..thumbnails import Thumbnail, generate_thumbnails
+from ..utils import eprint, find, first, first_or_none, load_html, print, wprint
 from . import Uploader
 
 
@@ -258,6 +260,19 @@ class nCoreUploader(Uploader):
 
         return return_data
 
+    def _thumbnail_width(self) -> int:
+        thumbnail_row_width = int(min(660, self.config.get(self, "snapshot_row_width", 660)))
+        if self.config.get(self, "snapshot_mosaic"):
+            # A contact sheet takes the whole row
+            return thumbnail_row_width
+        return int(thumbnail_row_width / self.config.get(self, "snapshot_row", 3))
+
+    def thumbnails(self, snapshots: list[Path]) -> dict[Thumbnail, list[Path]]:
+        # The last three are uploaded as files, the rest is linked in the description
+        if not snapshots[0:-3]:
+            return {}
+        return {Thumbnail(self._thumbnail_width(), "jpg"): snapshots[0:-3]}
+
     def login(self, *, args: Any) -> bool:
         if not args.disable_snapshots and self.config.get(self, "snapshots"):
             # set snapshots number from config
@@ -436,24 +451,26 @@ class nCoreUploader(Uploader):
             uploader = Img(self)
             thumbnails_str += "[spoiler=Screenshots][center]"
             snapshot_urls = []
-            for snap in uploader.upload(snapshots[0:-3]):
+            if (uploaded := uploader.upload(snapshots[0:-3])) is None:
+                return False
+            for snap in uploaded:
                 snapshot_urls.append(
                     f"https://i.kek.sh/{snap['filename']}"
                     if snap.get("filename")
                     else ""
                 )
 
-            thumbnail_row_width = min(
-                660, self.config.get(self, "snapshot_row_width", 660)
-            )
-            thumbnail_width = thumbnail_row_width / self.config.get(
-                self, "snapshot_row", 3
-            )
             thumbnail_urls = []
             thumbnails = generate_thumbnails(
-                snapshots[0:-3], width=thumbnail_width, file_type="jpg"
+                snapshots[0:-3],
+                width=self._thumbnail_width(),
+                file_type="jpg",
+                png_profile=self.config.get(self, "png_profile"),
+                png_zopfli=self.config.get(self, "png_zopfli"),
             )
-            for thumb in uploader.upload(thumbnails):
+            if (uploaded := uploader.upload(thumbnails)) is None:
+                return False
+            for thumb in uploaded:
                 thumbnail_urls.append(
                     f"https://i.kek.sh/{thumb['filename']}"
                     if thumb.get("filename")
@@ -10,7 +10,8 @@ from pyotp import TOTP
 from rich.markup import escape
 from rich.prompt import Prompt
 
-from ..utils import Img, eprint, load_html, print, wprint
+from ..imagehosts import Img
+from ..utils import eprint, load_html, print, wprint
 from . import Uploader
 
 
@@ -28,6 +29,7 @@ class PassThePopcornUploader(Uploader):
     announce_url: str = "http://please.passthepopcorn.me:2710/{passkey}/announce"  # HTTPS tracker cert is expired
     exclude_regexs: str = r".*\.(ffindex|jpg|png|srt|nfo|torrent|txt)$"
     all_files: bool = True
+    mosaic_snapshots: bool = False  # Every file's snapshot goes below its MediaInfo
 
     # TODO: Some of these have potential for false positives if they're in the movie name
     EDITION_MAP: dict = {
@@ -213,7 +215,9 @@ class PassThePopcornUploader(Uploader):
 
         snapshot_urls = []
         uploader = Img(self)
-        for snap in uploader.upload(snapshots):
+        if (uploaded := uploader.upload(snapshots)) is None:
+            return False
+        for snap in uploaded:
             snapshot_urls.append(
                 f'https://ptpimg.me/{snap[0]["code"]}.{snap[0]["ext"]}'
             )
@@ -1,34 +1,25 @@
 from __future__ import annotations
 
 import argparse
-import contextlib
 import itertools
 import os
 import re
 import shutil
 import sys
+import tempfile
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, IO, Iterable, Literal, NoReturn, Pattern, overload
 
 import humanize
-import oxipng
 import toml
 from bs4 import BeautifulSoup
 from requests.utils import CaseInsensitiveDict
 from rich.console import Console
-from rich.progress import (
-    BarColumn,
-    MofNCompleteColumn,
-    Progress,
-    ProgressColumn,
-    TaskProgressColumn,
-    TextColumn,
-    TimeRemainingColumn,
-)
+from rich.progress import ProgressColumn
 from rich.text import Text
-from wand.image import Image
 
 from .constants import PROG_NAME, PROG_VERSION
+from .png import DEFAULT_PNG_PROFILE, PNG_PROFILES
 
 
 if TYPE_CHECKING:
@@ -120,124 +111,17 @@ class CustomTransferSpeedColumn(ProgressColumn):
         return Text(f"{data_speed}/s", style="progress.data.speed")
 
 
-class Img:
-    def __init__(self, tracker: Uploader):
-        self.tracker = tracker
-        self.uploader = tracker.config.get(tracker, "img_uploader")
-        key_ = f"{self.uploader}_api_key"
-        self.api_key = (
-            tracker.config.get("img_uploaders", key_, None)
-            or os.environ.get(key_.upper())
-            or None
-        )
-
-    def hdbimg(
-        self, files: list[Path], thumbnail_width: int = 220, name: str = ""
-    ) -> list[Any | None] | None:
-        with Console().status(
-            "Uploading snapshots..."
-        ), contextlib.ExitStack() as stack:
-            r = self.tracker.session.post(
-                url="https://img.hdbits.org/upload_api.php",
-                files={
-                    **{
-                        f"images_files[{i}]": stack.enter_context(  # type: ignore[misc]
-                            snap.open("rb")
-                        )
-                        for i, snap in enumerate(files)
-                    },
-                    "thumbsize": f"w{thumbnail_width}",
-                    "galleryoption": "1",
-                    "galleryname": name,
-                },
-                timeout=60,
-            )
-        res = r.text
-        if res.startswith("error"):
-            error = re.sub(r"^error: ", "", res)
-            eprint(f"Snapshot upload failed: [cyan]{error}[/cyan]")
-            return []
-
-        return res.split()
-
-    def keksh(self, files: list[Path]) -> list[dict[Any, Any] | None] | None:
-        res = []
-        headers = dict()
-
-        if self.api_key:
-            headers = {"x-kek-auth": self.api_key}
-
-        with Progress(
-            TextColumn("[progress.description]{task.description}[/]"),
-            BarColumn(),
-            MofNCompleteColumn(),
-            TaskProgressColumn(),
-            TimeRemainingColumn(elapsed_when_finished=True),
-        ) as progress:
-            for snap in progress.track(files, description="Uploading snapshots"):
-                with open(snap, "rb") as fd:
-                    r = self.tracker.session.post(
-                        url="https://kek.sh/api/v1/posts",
-                        headers=headers,
-                        files={
-                            "file": fd,
-                        },
-                        timeout=60,
-                    )
-                    r.raise_for_status()
-                    res.append(r.json())
-
-        return res
-
-    def ptpimg(self, files: list[Path]) -> list[dict[Any, Any] | None] | None:
-        res = []
-
-        with Progress(
-            TextColumn("[progress.description]{task.description}[/]"),
-            BarColumn(),
-            MofNCompleteColumn(),
-            TaskProgressColumn(),
-            TimeRemainingColumn(elapsed_when_finished=True),
-        ) as progress:
-            for snap in progress.track(files, description="Uploading snapshots"):
-                with open(snap, "rb") as fd:
-                    r = self.tracker.session.post(
-                        url="https://ptpimg.me/upload.php",
-                        files={
-                            "file-upload[]": fd,
-                        },
-                        data={
-                            "api_key": self.api_key,
-                        },
-                        headers={
-                            "Referer": "https://ptpimg.me/index.php",
-                        },
-                        timeout=60,
-                    )
-                    r.raise_for_status()
-                    res.append(r.json())
-
-        return res
-
-    def upload(
-        self,
-        files: list[Path],
-        thumbnail_width: int | None = None,
-        name: str | None = None,
-    ) -> list[Any | dict[Any, Any] | None] | None:
-        if self.uploader == "keksh":
-            return self.keksh(files)
-        elif self.uploader == "ptpimg":
-            return self.ptpimg(files)
-        elif self.uploader == "hdbimg":
-            return self.hdbimg(files, thumbnail_width, name)
-        else:
-            if not self.uploader:
-                wprint("Img uploader missing for from config!")
-            else:
-                wprint("Set Img uploader doesn't exist!")
-
-            return []
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write a file under a unique temporary name first, so it's never found half-written."""
+    # Unique, as threads and overlapping runs may write the same cached file
+    fd = tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", delete=False)
+    try:
+        with fd:
+            fd.write(data)
+        os.replace(fd.name, path)
+    except BaseException:
+        os.unlink(fd.name)
+        raise
 
 
 def flatten(L: Iterable[Any]) -> list[Any]:
@@ -314,37 +198,17 @@ def first(iterable: Iterable[Any]) -> Any:
     return next(iter(iterable))
 
 
-def generate_thumbnails(
-    snapshots: list[Path],
-    width: int = 300,
-    file_type: str = "png",
-    *,
-    progress_obj: Progress | None = None,
-) -> list[Path]:
-    width = int(width)
-    print(f"Using thumbnail width: [bold cyan]{width}[/]")
-
-    thumbnails = []
-
-    with progress_obj or Progress(
-        TextColumn("[progress.description]{task.description}[/]"),
-        BarColumn(),
-        MofNCompleteColumn(),
-        TaskProgressColumn(),
-        TimeRemainingColumn(elapsed_when_finished=True),
-    ) as progress:
-        for snap in progress.track(snapshots, description="Generating thumbnails"):
-            thumb = snap.with_name(f"{snap.stem}_thumb_{width}.{file_type}")
-            if not thumb.exists():
-                with Image(filename=snap) as img:
-                    img.resize(width, round(img.height / (img.width / width)))
-                    img.depth = 8
-                    img.save(filename=thumb)
-                if file_type == "png":
-                    oxipng.optimize(thumb)
-            thumbnails.append(thumb)
-
-    return thumbnails
+def known_png_profile(profile: str | None) -> str:
+    """Return `profile`, or the default one with a warning when it's unknown."""
+    if profile is None:
+        return DEFAULT_PNG_PROFILE
+    if profile not in PNG_PROFILES:
+        wprint(
+            f"Unknown PNG profile [cyan]{profile}[/], expected one of"
+            f" {', '.join(PNG_PROFILES)}, using {DEFAULT_PNG_PROFILE}"
+        )
+        return DEFAULT_PNG_PROFILE
+    return profile
 
 
 def pluralize(count: int, singular: int, plural=None, include_count=True) -> str | Any:
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import zlib
+from pathlib import Path
+
+from torf import Torrent
+
+from pptu.checksums import CHECKSUM_FORMATS, DigestStore, FileDigests, write_sidecars
+from pptu.hashing import TorrentHasher
+
+
+PIECE_SIZE = 16 * 1024
+
+
+def test_sidecars_list_the_checksums_of_every_file(tmp_path: Path) -> None:
+    release = tmp_path / "release"
+    (release / "Sample").mkdir(parents=True)
+    (release / "a.mkv").write_bytes(os.urandom(5 * PIECE_SIZE + 123))
+    (release / "Sample" / "b.mkv").write_bytes(os.urandom(PIECE_SIZE // 3))
+    (release / "c.nfo").write_bytes(os.urandom(2 * PIECE_SIZE))
+    os.link(release / "c.nfo", release / "d.nfo")
+    store = DigestStore(tmp_path / "digests.db")
+    try:
+        digests = FileDigests(CHECKSUM_FORMATS.values(), store)
+        # Reads smaller than a piece arrive out of order across workers
+        TorrentHasher(
+            Torrent(release, piece_size=PIECE_SIZE), workers=4, read_size=4096, digests=digests
+        ).run()
+        written = write_sidecars(tmp_path, "release", release, CHECKSUM_FORMATS, digests.result())
+
+        cached = FileDigests(CHECKSUM_FORMATS.values(), store)
+        assert not cached.prepare(TorrentHasher(Torrent(release, piece_size=PIECE_SIZE)).layout.files)
+        assert cached.result() == digests.result()
+    finally:
+        store.close()
+
+    names = ["Sample/b.mkv", "a.mkv", "c.nfo", "d.nfo"]
+    data = [(release / x).read_bytes() for x in names]
+    assert written == [tmp_path / "release.sfv", tmp_path / "release.md5", tmp_path / "release.sha256"]
+    assert written[0].read_text().splitlines() == [
+        f"{name} {zlib.crc32(x):08X}" for name, x in zip(names, data, strict=True)
+    ]
+    assert written[1].read_text().splitlines() == [
+        f"{hashlib.md5(x).hexdigest()}  {name}" for name, x in zip(names, data, strict=True)
+    ]
+    assert written[2].read_text().splitlines() == [
+        f"{hashlib.sha256(x).hexdigest()}  {name}" for name, x in zip(names, data, strict=True)
+    ]
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import email.parser
+import json
+import socketserver
+import threading
+import xmlrpc.client
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs
+
+import pytest
+
+from pptu.clients import ClientError, ClientTorrent, QBittorrent, RTorrent, Transmission
+
+
+@contextmanager
+def serve(server: socketserver.BaseServer) -> Iterator[None]:
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class ScgiHandler(socketserver.StreamRequestHandler):
+    calls: list[tuple[dict[bytes, bytes], Any, str]] = []
+
+    def handle(self) -> None:
+        length = b""
+        while (char := self.rfile.read(1)) != b":":
+            length += char
+        fields = self.rfile.read(int(length)).split(b"\0")
+        headers = dict(zip(fields[0:-1:2], fields[1::2], strict=True))
+        assert self.rfile.read(1) == b","
+        params, method = xmlrpc.client.loads(
+            self.rfile.read(int(headers[b"CONTENT_LENGTH"]))
+        )
+        self.calls.append((headers, params, method))
+        body = xmlrpc.client.dumps(([[0] for _ in params[0]],), methodresponse=True)
+        self.wfile.write(b"Status: 200 OK\r\nContent-Type: text/xml\r\n\r\n" + body.encode())
+
+
+def test_rtorrent_loads_all_torrents_in_one_multicall() -> None:
+    torrents = [
+        ClientTorrent(b"d4:infod4:name1:aee", Path("/data/movies")),
+        ClientTorrent(b"d4:infod4:name1:bee", Path('/data/"quoted" \\ dir')),
+    ]
+    ScgiHandler.calls = []
+    with socketserver.TCPServer(("127.0.0.1", 0), ScgiHandler) as server:
+        host, port = server.server_address[:2]
+        with serve(server):
+            RTorrent(f"scgi://{host}:{port}").load(torrents)
+
+    assert len(ScgiHandler.calls) == 1
+    headers, params, method = ScgiHandler.calls[0]
+    assert headers[b"SCGI"] == b"1"
+    assert method == "system.multicall"
+    assert [x["methodName"] for x in params[0]] == ["load.raw_start"] * 2
+    assert [x["params"][1].data for x in params[0]] == [x.data for x in torrents]
+    assert [x["params"][2] for x in params[0]] == [
+        'd.directory.set="/data/movies"',
+        'd.directory.set="/data/\\"quoted\\" \\\\ dir"',
+    ]
+
+
+class TransmissionHandler(BaseHTTPRequestHandler):
+    session_id = "abc123"
+    requests: list[tuple[str | None, dict[str, Any]]] = []
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        session_id = self.headers.get("X-Transmission-Session-Id")
+        self.requests.append((session_id, request))
+        if session_id != self.session_id:
+            self.send_response(409)
+            self.send_header("X-Transmission-Session-Id", self.session_id)
+            self.end_headers()
+            return
+        body = json.dumps({"result": "success", "arguments": {}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def test_transmission_retries_with_the_session_id() -> None:
+    torrents = [
+        ClientTorrent(b"d4:infod4:name1:aee", Path("/data/a")),
+        ClientTorrent(b"d4:infod4:name1:bee", Path("/data/b")),
+    ]
+    TransmissionHandler.requests = []
+    with HTTPServer(("127.0.0.1", 0), TransmissionHandler) as server:
+        host, port = server.server_address[:2]
+        with serve(server):
+            Transmission(f"http://{host!s}:{port}/transmission/rpc").load(torrents)
+
+    # Only the first request is rejected, the session ID is kept for the rest
+    assert [x for x, _ in TransmissionHandler.requests] == [None, "abc123", "abc123"]
+    assert [x["arguments"]["download-dir"] for _, x in TransmissionHandler.requests] == [
+        "/data/a",
+        "/data/a",
+        "/data/b",
+    ]
+
+
+class QBittorrentHandler(BaseHTTPRequestHandler):
+    add_response = "Ok."
+    requests: list[tuple[str, str | None, dict[str, Any]]] = []
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        cookie = self.headers.get("Cookie")
+        if self.path == "/api/v2/auth/login":
+            form: dict[str, Any] = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+            ok = form == {"username": "admin", "password": "secret"}
+            self.respond("Ok." if ok else "Fails.", {"Set-Cookie": "SID=s1; path=/"} if ok else {})
+        elif self.path == "/api/v2/torrents/add":
+            message = email.parser.BytesParser().parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+            )
+            form = {}
+            for part in message.get_payload():
+                name = part.get_param("name", header="content-disposition")
+                if name == "torrents":
+                    form.setdefault(name, []).append(part.get_payload(decode=True))
+                else:
+                    form[name] = part.get_payload()
+            self.respond(self.add_response)
+        else:
+            self.send_error(404)
+            return
+        self.requests.append((self.path, cookie, form))
+
+    def respond(self, text: str, headers: dict[str, str] | None = None) -> None:
+        self.send_response(200)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        self.wfile.write(text.encode())
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def test_qbittorrent_adds_torrents_per_save_path() -> None:
+    torrents = [
+        ClientTorrent(b"d4:infod4:name1:aee", Path("/data/a")),
+        ClientTorrent(b"d4:infod4:name1:bee", Path("/data/b")),
+        ClientTorrent(b"d4:infod4:name1:cee", Path("/data/a")),
+    ]
+    QBittorrentHandler.requests = []
+    QBittorrentHandler.add_response = "Ok."
+    with HTTPServer(("127.0.0.1", 0), QBittorrentHandler) as server:
+        host, port = server.server_address[:2]
+        with serve(server):
+            QBittorrent(f"http://{host!s}:{port}/", "admin", "secret").load(torrents)
+
+    login, *adds = QBittorrentHandler.requests
+    assert login[:2] == ("/api/v2/auth/login", None)
+    # The session cookie of the login is sent along
+    assert [(x, y) for x, y, _ in adds] == [("/api/v2/torrents/add", "SID=s1")] * 2
+    assert [x["savepath"] for _, _, x in adds] == ["/data/a", "/data/b"]
+    assert [x["torrents"] for _, _, x in adds] == [
+        [torrents[0].data, torrents[2].data],
+        [torrents[1].data],
+    ]
+    assert {k: v for k, v in adds[0][2].items() if k not in ("savepath", "torrents")} == {
+        "skip_checking": "true",
+        "contentLayout": "Original",
+        "paused": "false",
+        "stopped": "false",
+    }
+
+
+def test_qbittorrent_raises_on_failures() -> None:
+    QBittorrentHandler.requests = []
+    QBittorrentHandler.add_response = "Fails."
+    with HTTPServer(("127.0.0.1", 0), QBittorrentHandler) as server:
+        host, port = server.server_address[:2]
+        with serve(server):
+            url = f"http://{host!s}:{port}"
+            with pytest.raises(ClientError, match="login failed"):
+                QBittorrent(url, "admin", "wrong").load([])
+            with pytest.raises(ClientError, match="rejected"):
+                QBittorrent(url).load([ClientTorrent(b"d4:infod4:name1:aee", Path("/data/a"))])
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+from torf import Torrent
+
+from pptu.hashing import Checkpoint, Layout, PieceHasher, PieceStore, TorrentHasher, hash_torrent, verify_pieces
+
+
+PIECE_SIZE = 16 * 1024
+
+
+def torf_pieces(path: Path, piece_size: int = PIECE_SIZE) -> bytes:
+    torrent = Torrent(path, piece_size=piece_size)
+    torrent.generate()
+    pieces: bytes = torrent.metainfo["info"]["pieces"]
+    return pieces
+
+
+def make_release(tmp_path: Path, sizes: list[int]) -> Path:
+    if len(sizes) == 1:
+        path = tmp_path / "single.mkv"
+        path.write_bytes(os.urandom(sizes[0]))
+        return path
+    path = tmp_path / "release"
+    for i, size in enumerate(sizes):
+        file = path / f"{i:02}" / f"part{i:02}.mkv"
+        file.parent.mkdir(parents=True)
+        file.write_bytes(os.urandom(size))
+    return path
+
+
+# Pieces spanning files, files smaller than a piece and a short last piece
+LAYOUTS = [
+    [5 * PIECE_SIZE + 1234],
+    [10_000, 3 * PIECE_SIZE + 77, 500, 2 * PIECE_SIZE, 40_001],
+]
+
+
+@pytest.mark.parametrize("io_mode", ["buffered", "direct", "network"])
+@pytest.mark.parametrize("sizes", LAYOUTS, ids=["single", "multi"])
+def test_pieces_match_torf(tmp_path: Path, sizes: list[int], io_mode: str) -> None:
+    path = make_release(tmp_path, sizes)
+    torrent = Torrent(path, piece_size=PIECE_SIZE)
+    TorrentHasher(torrent, workers=3, io_mode=io_mode, read_size=PIECE_SIZE).run()
+    assert torrent.metainfo["info"]["pieces"] == torf_pieces(path)
+
+
+def test_hash_torrent_matches_torf(tmp_path: Path) -> None:
+    path = make_release(tmp_path, LAYOUTS[1])
+    torrent = Torrent(path, piece_size=PIECE_SIZE)
+    hash_torrent(torrent, workers=2)
+    assert torrent.metainfo["info"]["pieces"] == torf_pieces(path)
+
+
+def rewrite_keeping_mtime(path: Path, data: bytes) -> None:
+    st = path.stat()
+    path.write_bytes(data)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def test_stored_pieces_of_changed_content_are_refused(tmp_path: Path) -> None:
+    file = tmp_path / "a.mkv"
+    file.write_bytes(os.urandom(4 * PIECE_SIZE))
+    store = PieceStore(tmp_path / "pieces.db")
+    try:
+        TorrentHasher(Torrent(file, piece_size=PIECE_SIZE), store=store).run()
+        rewrite_keeping_mtime(file, os.urandom(4 * PIECE_SIZE))
+
+        hasher = TorrentHasher(Torrent(file, piece_size=PIECE_SIZE), store=store)
+        assert hasher.cached == 4
+        assert not hasher.verify(samples=1)
+        assert hasher.cached == 0
+        hasher.run()
+        assert hasher.torrent.metainfo["info"]["pieces"] == torf_pieces(file)
+    finally:
+        store.close()
+
+
+def test_stored_pieces_of_unchanged_content_are_reused(tmp_path: Path) -> None:
+    file = tmp_path / "a.mkv"
+    file.write_bytes(os.urandom(4 * PIECE_SIZE))
+    store = PieceStore(tmp_path / "pieces.db")
+    try:
+        TorrentHasher(Torrent(file, piece_size=PIECE_SIZE), store=store).run()
+        hasher = TorrentHasher(Torrent(file, piece_size=PIECE_SIZE), store=store)
+        assert hasher.verify(samples=4)
+        assert hasher.cached == 4
+    finally:
+        store.close()
+
+
+def test_cached_torrent_of_changed_content_is_refused(tmp_path: Path) -> None:
+    file = tmp_path / "a.mkv"
+    file.write_bytes(os.urandom(4 * PIECE_SIZE))
+    pieces = torf_pieces(file)
+    written = file.stat().st_mtime_ns
+    rewrite_keeping_mtime(file, os.urandom(4 * PIECE_SIZE))
+
+    hasher = PieceHasher(Layout.from_torrent(Torrent(file, piece_size=PIECE_SIZE)))
+    assert not verify_pieces(hasher, pieces, samples=1, changed_since=written)
+
+
+def test_stored_pieces_are_reused(tmp_path: Path) -> None:
+    path = make_release(tmp_path, LAYOUTS[1])
+    store = PieceStore(tmp_path / "pieces.db")
+    try:
+        TorrentHasher(Torrent(path, piece_size=PIECE_SIZE), store=store).run()
+        hasher = TorrentHasher(Torrent(path, piece_size=PIECE_SIZE), store=store)
+        assert hasher.cached == hasher.layout.pieces
+        assert not hasher.missing
+        hasher.run()
+        assert hasher.torrent.metainfo["info"]["pieces"] == torf_pieces(path)
+    finally:
+        store.close()
+
+
+def test_checkpoint_is_kept_when_the_store_fails(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = make_release(tmp_path, LAYOUTS[0])
+    store = PieceStore(tmp_path / "pieces.db")
+    try:
+        hasher = TorrentHasher(Torrent(path, piece_size=PIECE_SIZE), store=store, checkpoint_dir=tmp_path)
+        monkeypatch.setattr(store, "put", Mock(side_effect=sqlite3.OperationalError("disk I/O error")))
+        with pytest.raises(sqlite3.Error):
+            hasher.run()
+    finally:
+        store.close()
+
+    assert hasher.checkpoint and hasher.checkpoint.path.exists()
+    resumed = TorrentHasher(Torrent(path, piece_size=PIECE_SIZE), checkpoint_dir=tmp_path)
+    assert resumed.resumed == resumed.layout.pieces
+
+
+def test_checkpoint_resumes_interrupted_hashing(tmp_path: Path) -> None:
+    path = make_release(tmp_path, LAYOUTS[1])
+    expected = torf_pieces(path)
+    layout = Layout.from_torrent(Torrent(path, piece_size=PIECE_SIZE))
+    checkpoint = Checkpoint.for_layout(tmp_path, layout)
+    for piece in range(0, layout.pieces, 2):
+        checkpoint.add(piece, expected[piece * 20 : piece * 20 + 20])
+    checkpoint.flush()
+    # A record torn by a crash is dropped
+    with checkpoint.path.open("ab") as fd:
+        fd.write(b"\0\0\0")
+
+    hasher = TorrentHasher(Torrent(path, piece_size=PIECE_SIZE), checkpoint_dir=tmp_path)
+    assert hasher.resumed == (layout.pieces + 1) // 2
+    hasher.run()
+    assert hasher.torrent.metainfo["info"]["pieces"] == expected
+    assert not checkpoint.path.exists()
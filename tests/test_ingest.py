@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from torf import Torrent
+
+from pptu.ingest import Ingest
+from pptu.torrent_v2 import FileHashStore, V2Hasher
+
+
+def test_layouts_with_different_piece_sizes(tmp_path: Path) -> None:
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.mkv").write_bytes(os.urandom(300 * 1024))
+    (src / "b.mkv").write_bytes(os.urandom(70 * 1024))
+    dest = tmp_path / "dest"
+    piece_sizes = (16 * 1024, 64 * 1024)
+
+    ingest = Ingest(src, dest, [(Torrent(src, piece_size=x), True) for x in piece_sizes])
+    ingest.run()
+    assert ingest.store(tmp_path / "pieces.db") == len(piece_sizes)
+
+    store = FileHashStore(tmp_path / "pieces.db")
+    try:
+        for piece_size in piece_sizes:
+            hasher = V2Hasher(Torrent(dest, piece_size=piece_size))
+            for file, expected in zip(hasher.layout.files, hasher.run(), strict=True):
+                cached = store.get(FileHashStore.key(file.identity, piece_size))
+                assert cached == expected.hashes
+    finally:
+        store.close()
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from torf import Torrent
+
+from pptu.hashing import Layout, TorrentHasher
+from pptu.library import TorrentIndex
+
+
+PIECE_SIZE = 16 * 1024
+
+
+def test_index_lookup_reuses_pieces_of_a_cross_seed(tmp_path: Path) -> None:
+    release = tmp_path / "release"
+    release.mkdir()
+    (release / "a.mkv").write_bytes(os.urandom(2 * PIECE_SIZE))
+    (release / "b.mkv").write_bytes(data := os.urandom(3 * PIECE_SIZE + 100))
+    torrent = Torrent(release, piece_size=PIECE_SIZE)
+    torrent.generate()
+    torrent_path = tmp_path / "torrents" / "release.torrent"
+    torrent_path.parent.mkdir()
+    torrent.write(torrent_path)
+
+    # The second file alone, as another tracker would want it
+    single = tmp_path / "single" / "b.mkv"
+    single.parent.mkdir()
+    single.write_bytes(data)
+    expected = Torrent(single, piece_size=PIECE_SIZE)
+    expected.generate()
+
+    index = TorrentIndex(tmp_path / "index.db")
+    try:
+        assert index.scan([torrent_path.parent]) == (1, 0)
+        assert index.scan([torrent_path.parent]) == (0, 0)
+
+        hasher = TorrentHasher(Torrent(single, piece_size=PIECE_SIZE))
+        candidates = index.lookup(Layout.from_torrent(hasher.torrent))
+        assert [x.torrent_path for x in candidates] == [torrent_path]
+        assert hasher.reuse(x.pieces for x in candidates) == 4
+        assert not hasher.missing
+        hasher.run()
+        assert hasher.torrent.metainfo["info"]["pieces"] == expected.metainfo["info"]["pieces"]
+
+        # A different piece size doesn't line up
+        assert not index.lookup(Layout.from_torrent(Torrent(single, piece_size=2 * PIECE_SIZE)))
+
+        torrent_path.unlink()
+        assert index.scan([torrent_path.parent]) == (0, 1)
+        assert not index.lookup(Layout.from_torrent(hasher.torrent))
+    finally:
+        index.close()
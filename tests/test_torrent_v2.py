@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+
+from torf import Torrent
+
+from pptu.torrent_v2 import BLOCK_SIZE, FileHashes, V2Hasher, metainfo
+
+
+PIECE_SIZE = 4 * BLOCK_SIZE
+
+# Several pieces with a short last block, exactly whole blocks, and files within one piece
+SIZES = {
+    "a.mkv": 3 * PIECE_SIZE + 5000,
+    "b.mkv": 5 * BLOCK_SIZE,
+    "c/d.nfo": 20_000,
+    "c/e.txt": 100,
+}
+
+
+def tree(nodes: list[bytes], width: int) -> bytes:
+    nodes = nodes + [bytes(32)] * (width - len(nodes))
+    while len(nodes) > 1:
+        nodes = [hashlib.sha256(nodes[i] + nodes[i + 1]).digest() for i in range(0, len(nodes), 2)]
+    return nodes[0]
+
+
+def reference(data: bytes) -> FileHashes:
+    """Hashes of a file as spelled out by BEP 52, and v1 pieces padded with zeros like BEP 47."""
+    leaves = [hashlib.sha256(data[i : i + BLOCK_SIZE]).digest() for i in range(0, len(data), BLOCK_SIZE)]
+    per_piece = PIECE_SIZE // BLOCK_SIZE
+    pieces = -(-len(data) // PIECE_SIZE)
+    if pieces == 1:
+        root, layer = tree(leaves, 1 << (len(leaves) - 1).bit_length()), b""
+    else:
+        root = tree(leaves, (1 << (pieces - 1).bit_length()) * per_piece)
+        layer = b"".join(tree(leaves[i : i + per_piece], per_piece) for i in range(0, len(leaves), per_piece))
+    padded = data + bytes(-len(data) % PIECE_SIZE)
+    v1 = b"".join(hashlib.sha1(padded[i : i + PIECE_SIZE]).digest() for i in range(0, len(padded), PIECE_SIZE))
+    tail = hashlib.sha1(data[(pieces - 1) * PIECE_SIZE :]).digest()
+    return FileHashes(root, layer, v1, tail)
+
+
+def test_roots_layers_and_padded_v1_pieces(tmp_path: Path) -> None:
+    path = tmp_path / "release"
+    contents = {}
+    for name, size in SIZES.items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_bytes(data := os.urandom(size))
+        contents[tuple(name.split("/"))] = data
+
+    files = V2Hasher(Torrent(path, piece_size=PIECE_SIZE), workers=2).run()
+    assert [x.path for x in files] == sorted(contents)
+    for file in files:
+        assert file.hashes == reference(contents[file.path])
+
+    info = metainfo(files, name="release", piece_size=PIECE_SIZE, hybrid=True, trackers=[])
+    assert info["piece layers"] == {x.hashes.root: x.hashes.layer for x in files if x.hashes and x.hashes.layer}
+    assert info["info"]["pieces"] == b"".join(reference(contents[x.path]).v1 for x in files)
+    assert sum(x["length"] for x in info["info"]["files"]) % PIECE_SIZE == 0
+
+
+def test_single_file_hybrid_matches_torf(tmp_path: Path) -> None:
+    file = tmp_path / "a.mkv"
+    file.write_bytes(data := os.urandom(SIZES["a.mkv"]))
+    torrent = Torrent(file, piece_size=PIECE_SIZE)
+    torrent.generate()
+
+    files = V2Hasher(Torrent(file, piece_size=PIECE_SIZE)).run()
+    info = metainfo(files, name="a.mkv", piece_size=PIECE_SIZE, hybrid=True, trackers=[])
+    assert info["info"]["pieces"] == torrent.metainfo["info"]["pieces"]
+    assert info["info"]["file tree"] == {
+        "a.mkv": {"": {"length": len(data), "pieces root": reference(data).root}}
+    }
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pptu.utils import write_atomic
+
+
+def test_concurrent_atomic_writes_of_the_same_file(tmp_path: Path) -> None:
+    path = tmp_path / "snapshot.png"
+    data = [bytes([i]) * 1024**2 for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for future in [pool.submit(write_atomic, path, x) for x in data]:
+            future.result()
+
+    assert path.read_bytes() in data
+    assert [x.name for x in tmp_path.iterdir()] == [path.name]